@@ -0,0 +1,120 @@
+"""
+Indexed per-person assignment archive.
+
+Next to every `*_gift_assignments.txt` file an `.idx` object is written with
+the same assignment laid out as an open-addressing hash table of fixed-width
+records:
+
+    [256 byte JSON header][slot 0][slot 1]...[slot M-1]
+
+Each slot is `record_size` bytes: "giver<TAB>recipient" padded with spaces and
+terminated by a newline (empty slots are all spaces). A person's slot is found
+by hashing their name, so a lookup is an HTTP Range GET for the header plus a
+Range GET for a small window of slots, no matter how large the exchange is.
+"""
+
+import hashlib
+import io
+import json
+from metrics import metrics
+
+INDEX_SUFFIX = '.idx'
+HEADER_SIZE = 256
+FORMAT_NAME = 'xmas-xchange-index'
+FORMAT_VERSION = 1
+
+# Slots fetched per Range GET while probing
+PROBE_WINDOW = 8
+
+
+def index_key(file_name):
+    """Return the S3 key of the index for an assignment file"""
+    return f"{file_name}{INDEX_SUFFIX}"
+
+
+def _slot(name, slots):
+    """Stable hash of a name to a slot number"""
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % slots
+
+
+def build_index(assignment):
+    """Return the index bytes for a person -> recipient assignment"""
+    records = {person: f"{person}\t{recipient}".encode('utf-8') for person, recipient in assignment.items()}
+    record_size = max((len(record) for record in records.values()), default=0) + 1
+
+    # Keep the table at most half full so probe sequences stay short
+    slots = 8
+    while slots < 2 * len(records):
+        slots *= 2
+
+    empty = b' ' * (record_size - 1) + b'\n'
+    table = bytearray(empty * slots)
+    for person, record in records.items():
+        slot = _slot(person, slots)
+        while table[slot * record_size:(slot + 1) * record_size] != empty:
+            slot = (slot + 1) % slots
+        table[slot * record_size:(slot + 1) * record_size] = record.ljust(record_size - 1) + b'\n'
+
+    header = json.dumps({
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'slots': slots,
+        'record_size': record_size,
+    }).encode('utf-8')
+    return header.ljust(HEADER_SIZE - 1) + b'\n' + bytes(table)
+
+
+def lookup(read_range, person):
+    """
+    Look up person's recipient in an index.
+
+    read_range(start, end) must return the bytes from start to end inclusive.
+    Returns the recipient, or None if the person is not in the index.
+    """
+    header = json.loads(read_range(0, HEADER_SIZE - 1))
+    if header.get('format') != FORMAT_NAME or header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format: {header.get('format')} v{header.get('version')}")
+    slots = header['slots']
+    record_size = header['record_size']
+
+    slot = _slot(person, slots)
+    for _ in range(0, slots, PROBE_WINDOW):
+        count = min(PROBE_WINDOW, slots - slot)
+        start = HEADER_SIZE + slot * record_size
+        window = read_range(start, start + count * record_size - 1)
+        for i in range(count):
+            record = window[i * record_size:(i + 1) * record_size].rstrip()
+            if not record:
+                return None
+            giver, _, recipient = record.decode('utf-8').partition('\t')
+            if giver == person:
+                return recipient
+        slot = (slot + count) % slots
+    return None
+
+
+def upload_index(s3_client, bucket_name, file_name, assignment):
+    """Upload the per-person index for an assignment file"""
+    data = build_index(assignment)
+    s3_client.upload_fileobj(io.BytesIO(data), bucket_name, index_key(file_name))
+    metrics.count('s3_bytes_uploaded', len(data))
+
+
+def is_not_found(error):
+    """Return True if a boto3 error means the object doesn't exist"""
+    response = getattr(error, 'response', None) or {}
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    code = response.get('Error', {}).get('Code')
+    return status == 404 or code in ('404', 'NoSuchKey')
+
+
+def fetch_recipient(s3_client, bucket_name, file_name, person):
+    """Look up one person's recipient through the assignment file's index using Range GETs"""
+    key = index_key(file_name)
+
+    def read_range(start, end):
+        response = s3_client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end}")
+        return response['Body'].read()
+
+    return lookup(read_range, person)
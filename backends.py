@@ -0,0 +1,227 @@
+"""
+Local storage and SMS backends.
+
+STORAGE_BACKEND picks where assignment files are kept: 's3' (the default,
+a boto3 client), 'fs' (a local directory) or 'memory' (this process only).
+SMS_BACKEND picks how messages go out: 'twilio' (the default), 'log'
+(appended to a JSON Lines file, nothing is sent) or 'memory' (kept in this
+process only). The local backends implement just the parts of the boto3 S3
+client and the Twilio REST client that this project calls, so the rest of the
+code works the same with any of them.
+"""
+
+import abc
+import bisect
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from decouple import config
+
+STORAGE_BACKENDS = ('s3', 'fs', 'memory')
+SMS_BACKENDS = ('twilio', 'log', 'memory')
+
+DEFAULT_STORAGE_DIR = 'storage'
+DEFAULT_MAX_KEYS = 1000
+DEFAULT_SMS_LOG = 'sms_log.jsonl'
+
+# Contents of the 'memory' backends, shared by every client in the process
+MEMORY_OBJECTS = {}  # (bucket, key) -> bytes
+MEMORY_MESSAGES = []  # message records in the order they were sent
+
+
+class BackendError(Exception):
+    """Error shaped like botocore's ClientError so callers can inspect error.response"""
+
+    def __init__(self, code, message, status):
+        super().__init__(f"An error occurred ({code}): {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+def storage_backend():
+    """Return the configured storage backend name"""
+    backend = config('STORAGE_BACKEND', default='s3').lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected one of: {', '.join(STORAGE_BACKENDS)})")
+    return backend
+
+
+def sms_backend():
+    """Return the configured SMS backend name"""
+    backend = config('SMS_BACKEND', default='twilio').lower()
+    if backend not in SMS_BACKENDS:
+        raise ValueError(f"Unknown SMS_BACKEND '{backend}' (expected one of: {', '.join(SMS_BACKENDS)})")
+    return backend
+
+
+def _etag(data):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _byte_range(data, range_header):
+    """Return the slice of data selected by an HTTP Range header like 'bytes=0-255'"""
+    start, _, end = range_header.replace('bytes=', '', 1).partition('-')
+    if not start:
+        return data[-int(end):]
+    return data[int(start):int(end) + 1 if end else None]
+
+
+class LocalStorage(abc.ABC):
+    """Base for the local S3 stand-ins; subclasses store and fetch the raw bytes"""
+
+    @abc.abstractmethod
+    def _read(self, bucket_name, key):
+        """Return the object's bytes, or None if there is no such key"""
+
+    @abc.abstractmethod
+    def _write(self, bucket_name, key, data):
+        """Store the object's bytes"""
+
+    @abc.abstractmethod
+    def _keys(self, bucket_name):
+        """Return every key in the bucket"""
+
+    def head_bucket(self, Bucket):
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        self._write(Bucket, Key, Fileobj.read())
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None):
+        data = self._read(Bucket, Key)
+        if data is None:
+            raise BackendError('NoSuchKey', f"The specified key does not exist: {Key}", 404)
+        etag = _etag(data)
+        if IfNoneMatch == etag:
+            raise BackendError('304', 'Not Modified', 304)
+        if Range:
+            data = _byte_range(data, Range)
+        return {'Body': io.BytesIO(data), 'ETag': etag, 'ContentLength': len(data)}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', ContinuationToken=None, MaxKeys=DEFAULT_MAX_KEYS):
+        keys = sorted(key for key in self._keys(Bucket) if key.startswith(Prefix))
+        # The continuation token is simply the last key of the previous page
+        after = ContinuationToken or StartAfter
+        keys = keys[bisect.bisect_right(keys, after):] if after else keys
+        page = keys[:MaxKeys]
+        response = {'Contents': [{'Key': key} for key in page], 'KeyCount': len(page), 'IsTruncated': len(keys) > MaxKeys}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+
+class MemoryStorage(LocalStorage):
+    """S3 stand-in that keeps objects in memory for the life of the process"""
+
+    def _read(self, bucket_name, key):
+        return MEMORY_OBJECTS.get((bucket_name, key))
+
+    def _write(self, bucket_name, key, data):
+        MEMORY_OBJECTS[(bucket_name, key)] = data
+
+    def _keys(self, bucket_name):
+        return [key for bucket, key in MEMORY_OBJECTS if bucket == bucket_name]
+
+
+class FilesystemStorage(LocalStorage):
+    """S3 stand-in that keeps objects as files under directory/bucket/key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, bucket_name, key):
+        bucket_dir = os.path.abspath(os.path.join(self.directory, bucket_name))
+        path = os.path.abspath(os.path.join(bucket_dir, key))
+        if not path.startswith(bucket_dir + os.sep):
+            raise BackendError('InvalidKey', f"Key escapes the bucket directory: {key}", 400)
+        return path
+
+    def head_bucket(self, Bucket):
+        os.makedirs(os.path.join(self.directory, Bucket), exist_ok=True)
+        return {}
+
+    def _read(self, bucket_name, key):
+        try:
+            with open(self._path(bucket_name, key), 'rb') as object_file:
+                return object_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, bucket_name, key, data):
+        path = self._path(bucket_name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as object_file:
+            object_file.write(data)
+        os.replace(temp_path, path)
+
+    def _keys(self, bucket_name):
+        bucket_dir = os.path.join(self.directory, bucket_name)
+        for root, _, files in os.walk(bucket_dir):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    yield os.path.relpath(os.path.join(root, name), bucket_dir).replace(os.sep, '/')
+
+
+def create_local_storage(backend):
+    """Return the local storage client for a non-S3 backend"""
+    if backend == 'fs':
+        return FilesystemStorage(config('STORAGE_DIR', default=DEFAULT_STORAGE_DIR))
+    return MemoryStorage()
+
+
+class _LocalMessages:
+    """Stand-in for client.messages that hands each message to deliver() instead of sending it"""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def create(self, to, from_, body):
+        record = {
+            'sid': f"SM{uuid.uuid4().hex}",
+            'to': to,
+            'from_': from_,
+            'body': body,
+            'status': 'queued',
+            'date_created': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.deliver(record)
+        return SimpleNamespace(**record)
+
+
+class _LocalAccounts:
+    """Stand-in for client.api.accounts; every account exists"""
+
+    def get(self, account_sid):
+        return SimpleNamespace(sid=account_sid, fetch=lambda: SimpleNamespace(sid=account_sid, status='active'))
+
+
+class LocalSmsClient:
+    """Stand-in for the Twilio REST client used by the 'log' and 'memory' SMS backends"""
+
+    def __init__(self, deliver):
+        self.messages = _LocalMessages(deliver)
+        self.api = SimpleNamespace(base_url=None, accounts=_LocalAccounts())
+
+
+def _log_writer(path):
+    """Return a thread-safe function that appends message records to a JSON Lines file"""
+    lock = threading.Lock()
+
+    def deliver(record):
+        with lock:
+            with open(path, 'a') as log_file:
+                log_file.write(json.dumps(record) + '\n')
+
+    return deliver
+
+
+def create_local_sms_client(backend):
+    """Return the local SMS client for a non-Twilio backend"""
+    if backend == 'log':
+        return LocalSmsClient(_log_writer(config('SMS_LOG_PATH', default=DEFAULT_SMS_LOG)))
+    return LocalSmsClient(MEMORY_MESSAGES.append)
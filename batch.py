@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Run many independent gift exchanges in one go.
+
+Takes a directory of roster files (.json in the json/data.json format, .jsonl
+or .csv) or a manifest listing them. The assignments are generated in parallel on a process
+pool, while the S3 and Twilio connections are checked once for all of them.
+Every exchange's file is then uploaded to S3 under a folder named after its
+roster, and all the SMS messages go out through one shared dispatcher. One
+consolidated JSON report covers every exchange.
+"""
+
+import startup  # first, so --startup-report can time the imports below
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from helper import assignment_file_name, upload_assignment_data_to_s3, load_main_module, Colors
+from constraints import ConstraintIndex
+from roster import load_roster, JSON_LINES_EXTENSIONS, CSV_EXTENSION
+from dispatch import SmsDispatcher
+from feasibility import check_feasibility
+from journal import SendJournal, new_run_id
+from metrics import metrics, write_metrics_at_exit
+from session import ServiceSession
+from solver import INFEASIBLE
+
+# Files picked up from a rosters directory
+ROSTER_EXTENSIONS = ('.json', CSV_EXTENSION) + JSON_LINES_EXTENSIONS
+
+# Uploads in flight at once through the shared S3 client
+UPLOAD_WORKERS = 8
+
+# Shared with the worker processes for message formatting and generation
+xmas_xchange = load_main_module()
+
+
+def parse_arguments():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description='Run several Christmas Gift Exchanges at once')
+    parser.add_argument('rosters', help='Directory of roster files (.json, .jsonl or .csv), or a manifest file listing one roster path per line')
+    parser.add_argument('--dry-run', action='store_true', help='Do a dry-run without sending SMS messages to the recipients.')
+    parser.add_argument('--workers', type=int, default=None, help='Processes used to generate the assignments (default: one per CPU core)')
+    parser.add_argument('--report', metavar='PATH', help='Write a consolidated JSON report of every exchange and message to PATH')
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write the time spent in each phase, counters and S3/Twilio call latencies to PATH as JSON.')
+    parser.add_argument(startup.STARTUP_REPORT_FLAG, action='store_true', help='Print how long each module took to import to stderr when done')
+    return parser.parse_args()
+
+
+def find_rosters(path):
+    """Return (exchange name, roster path) for each roster in a directory or manifest"""
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(ROSTER_EXTENSIONS)]
+    else:
+        base = os.path.dirname(path)
+        with open(path) as manifest_file:
+            lines = [line.strip() for line in manifest_file]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+    rosters = []
+    for roster_path in paths:
+        # The name becomes the S3 folder and part of the journal run ID
+        name = re.sub(r'[^\w-]', '_', os.path.splitext(os.path.basename(roster_path))[0])
+        rosters.append((name, roster_path))
+    return rosters
+
+
+def solve_exchange(roster_path):
+    """Load one roster and generate its assignment (runs in a worker process)"""
+    try:
+        roster = load_roster(roster_path)
+    except (OSError, ValueError) as e:
+        return {'roster': None, 'assignment': None, 'solver': {'status': 'unreadable'}, 'problems': [str(e)]}
+    index = ConstraintIndex.from_roster(roster)
+
+    problems = check_feasibility(index, hide_names=True)
+    if problems:
+        return {'roster': roster, 'assignment': None, 'solver': {'status': INFEASIBLE}, 'problems': problems}
+
+    stats = {}
+    assignment = xmas_xchange.generate_assignment(index, stats)
+    return {'roster': roster, 'assignment': assignment, 'solver': stats, 'problems': []}
+
+
+def prepare_exchange(name, result, is_dry_run):
+    """Return the exchange summary, its assignment file contents (a generator) and its SMS jobs"""
+    roster = result['roster']
+    exchange = {
+        'name': name,
+        'people': len(roster) if roster is not None else 0,
+        'status': 'dry-run' if is_dry_run else 'sent',
+        'file_name': None,
+        'sent': 0,
+        'failed': 0,
+        # Without the seed, which would let anyone with the roster reproduce the assignment
+        'solver': {key: value for key, value in result['solver'].items() if key != 'seed'},
+        'problems': result['problems'],
+    }
+    if result['assignment'] is None:
+        exchange['status'] = result['solver'].get('status')
+        return exchange, None, []
+
+    assignment = dict(sorted(result['assignment'].items()))
+    assignment_data = xmas_xchange.assignment_file_data(assignment, roster, is_dry_run, seed=result['solver'].get('seed'))
+    jobs = []
+    if not is_dry_run:
+        for person, recipient in assignment.items():
+            message = xmas_xchange.create_message(person, recipient)
+            jobs.append({'exchange': name, 'person': person, 'recipient': recipient, 'to': roster.phone_number(person), 'body': message})
+    exchange['file_name'] = assignment_file_name(is_dry_run, prefix=f"{name}/")
+    return exchange, assignment_data, jobs
+
+
+def print_summary(exchanges):
+    """Print one line per exchange"""
+    for exchange in exchanges:
+        name = f"{Colors.BLUE}{exchange['name']}{Colors.END}"
+        if exchange['file_name'] is None:
+            print(f"❌ {name}: no assignment ({exchange['status']}, {exchange['people']} people)")
+            for problem in exchange['problems']:
+                print(f"  - {problem}")
+        elif exchange['status'] == 'dry-run':
+            print(f"✅ {name}: {exchange['people']} people, dry run written to {exchange['file_name']}")
+        elif exchange['failed']:
+            print(f"❌ {name}: {exchange['failed']} of {exchange['people']} messages failed, file written to {exchange['file_name']}")
+        else:
+            print(f"✅ {name}: {exchange['sent']} messages sent, file written to {exchange['file_name']}")
+
+
+def main():
+    args = parse_arguments()
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json)
+
+    rosters = find_rosters(args.rosters)
+    if not rosters:
+        print(f"❌ No roster files found in {args.rosters}.")
+        return 1
+    names = [name for name, _ in rosters]
+    if len(set(names)) != len(names):
+        print("❌ Roster file names must be unique, since they name each exchange's folder in S3.")
+        return 1
+
+    # Generate every assignment in parallel while the connections are being checked
+    metrics.begin_phase('generate')
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(solve_exchange, path) for _, path in rosters]
+        session = ServiceSession()
+        if not session.check_connections():
+            for future in futures:
+                future.cancel()
+            return 1
+        results = [future.result() for future in futures]
+
+    metrics.begin_phase('format')
+    exchanges, uploads, jobs = [], [], []
+    for (name, _), result in zip(rosters, results):
+        exchange, assignment_data, exchange_jobs = prepare_exchange(name, result, args.dry_run)
+        exchanges.append(exchange)
+        if assignment_data is not None:
+            uploads.append((exchange, assignment_data, result['assignment']))
+            jobs.extend(exchange_jobs)
+
+    # Upload every file before sending, so resuming an interrupted exchange only has messages left
+    metrics.begin_phase('upload')
+    s3_client = session.s3_client
+
+    def upload(item):
+        exchange, assignment_data, assignment = item
+        upload_assignment_data_to_s3(s3_client, assignment_data, args.dry_run, False, assignment, exchange['file_name'])
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        list(executor.map(upload, uploads))
+
+    # One journal per exchange, so each can be resumed with xmas-xchange.py --resume
+    results = []
+    if jobs:
+        metrics.begin_phase('journal')
+        run_id = new_run_id()
+        journals = {}
+        for exchange, _, _ in uploads:
+            exchange_jobs = [job for job in jobs if job['exchange'] == exchange['name']]
+            journal = SendJournal(f"{run_id}_{exchange['name']}", s3_client)
+            journal.record_assignment(exchange_jobs)
+            journal.record_upload(exchange['file_name'])
+            journals[exchange['name']] = journal
+        print(f"📒 Send journal run IDs: {run_id}_<exchange> (if this run is interrupted, use --resume {run_id}_<exchange>)")
+
+        # All messages share one dispatcher, so the rate limit covers the sending number as a whole
+        metrics.begin_phase('send')
+        dispatcher = SmsDispatcher(session.twilio_client)
+        results = dispatcher.send_all(
+            jobs,
+            lambda job: journals[job['exchange']].record_sending(job),
+            lambda result: journals[result['exchange']].record_result(result),
+        )
+        for journal in journals.values():
+            journal.upload()
+
+        by_name = {exchange['name']: exchange for exchange in exchanges}
+        for result in results:
+            by_name[result['exchange']]['sent' if result['status'] == 'sent' else 'failed'] += 1
+        for exchange in exchanges:
+            if exchange['failed']:
+                exchange['status'] = 'failed'
+    metrics.end_phase()
+
+    print_summary(exchanges)
+    if args.report:
+        report = {
+            'dry_run': args.dry_run,
+            'exchanges': exchanges,
+            'sent': sum(exchange['sent'] for exchange in exchanges),
+            'failed': sum(exchange['failed'] for exchange in exchanges),
+            'messages': results,
+        }
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"✅ Batch report written to {args.report}")
+
+    all_ok = all(exchange['file_name'] is not None and not exchange['failed'] for exchange in exchanges)
+    return 0 if all_ok else 1
+
+
+if __name__ == '__main__':
+    exit(main())
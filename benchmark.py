@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the gift exchange pipeline.
+
+Builds synthetic json/data.json style rosters of different sizes and
+constraint profiles and times each phase of a run: loading the roster (from
+JSON Lines), compiling the constraints, generating the assignment, validating
+it, formatting the messages, and serializing/uploading and parsing the
+assignment file (against the in-memory storage backend, so nothing touches
+the network). Results can be written as
+JSON and compared against an earlier run to flag slowdowns between commits.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+# The helpers read the bucket name from the environment; the in-memory storage backend accepts any name
+os.environ.setdefault('S3_BUCKET', 'xmas-xchange-benchmark')
+
+from helper import upload_assignment_data_to_s3, iter_assignments, iter_lines, decompressed, load_main_module, Colors
+from constraints import ConstraintIndex
+from roster import read_json_lines
+from validation import assignment_issues
+from backends import MemoryStorage, MEMORY_OBJECTS
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+PROFILES = ['none', 'couples', 'households', 'random']
+DEFAULT_PROFILES = ['couples', 'households', 'random']
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 2024
+
+# Random exclusions per person in the 'random' profile
+RANDOM_EXCLUSIONS = 10
+
+# Largest household in the 'households' profile
+MAX_HOUSEHOLD = 6
+
+# A phase counts as a regression when it is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.25
+# ...and at least this many seconds slower, so timer noise on tiny phases is ignored
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def generate_roster(size, profile, rng):
+    """Return a synthetic people dict in the json/data.json format"""
+    names = [f"Person{i:06d}" for i in range(size)]
+    constraints = {name: [] for name in names}
+
+    if profile == 'couples':
+        for i in range(0, size - 1, 2):
+            constraints[names[i]].append(names[i + 1])
+            constraints[names[i + 1]].append(names[i])
+    elif profile == 'households':
+        i = 0
+        while i < size:
+            household = names[i:i + rng.randint(2, MAX_HOUSEHOLD)]
+            for name in household:
+                constraints[name].extend(other for other in household if other != name)
+            i += len(household)
+    elif profile == 'random':
+        exclusions = min(RANDOM_EXCLUSIONS, max(0, size // 4))
+        for i, name in enumerate(names):
+            excluded = set()
+            while len(excluded) < exclusions:
+                j = rng.randrange(size)
+                if j != i:
+                    excluded.add(names[j])
+            constraints[name].extend(sorted(excluded))
+
+    return {
+        name: {'phone_number': f"+1555{i:07d}", 'constraints': constraints[name]}
+        for i, name in enumerate(names)
+    }
+
+
+def run_case(main_module, size, profile, repeat, seed):
+    """Time every phase for one roster and return its result record"""
+    people_info = generate_roster(size, profile, random.Random(seed))
+    roster_lines = ''.join(json.dumps({'name': name, **info}) + '\n' for name, info in people_info.items())
+    timings = {}
+
+    def timed(phase, func):
+        start = time.perf_counter()
+        value = func()
+        timings.setdefault(phase, []).append(time.perf_counter() - start)
+        return value
+
+    def format_messages():
+        # Mirrors the message loop in xmas-xchange.py, plus the file contents it streams into the upload
+        jobs = []
+        for person, recipient in assignment.items():
+            person_phone = roster.phone_number(person)
+            message = main_module.create_message(person, recipient)
+            jobs.append({'person': person, 'recipient': recipient, 'to': person_phone, 'body': message})
+        return list(main_module.assignment_file_data(assignment, roster, True))
+
+    def parse_file():
+        response = s3_client.get_object(Bucket=os.environ['S3_BUCKET'], Key=file_name)
+        return dict(iter_assignments(iter_lines(decompressed(response['Body'], file_name))))
+
+    stats = {}
+    for round_number in range(repeat):
+        roster = timed('load', lambda: read_json_lines(io.StringIO(roster_lines)))
+        index = timed('index', lambda: ConstraintIndex.from_roster(roster))
+        assignment = timed('generate', lambda: main_module.generate_assignment(index, stats, seed + round_number))
+        if assignment is None:
+            break
+        assignment = dict(sorted(assignment.items()))
+        valid = timed('validate', lambda: main_module.check_constraints(assignment, index))
+        issues = timed('validate_full', lambda: assignment_issues(assignment, index))
+        if not valid or issues['cycles'] != 1:
+            raise RuntimeError(f"Invalid assignment generated for {profile} roster of {size}")
+        assignment_data = timed('format', format_messages)
+        MEMORY_OBJECTS.clear()
+        s3_client = MemoryStorage()
+        file_name = timed('serialize', lambda: upload_assignment_data_to_s3(s3_client, assignment_data, True, False, assignment))
+        parsed = timed('parse', parse_file)
+        if parsed != assignment:
+            raise RuntimeError(f"Assignment file for {profile} roster of {size} did not parse back correctly")
+
+    return {
+        'profile': profile,
+        'size': size,
+        'constraints': sum(len(info['constraints']) for info in people_info.values()),
+        'solver': stats,
+        'phases': {
+            phase: {'median': statistics.median(samples), 'min': min(samples), 'runs': len(samples)}
+            for phase, samples in timings.items()
+        },
+    }
+
+
+def git_commit():
+    """Return the current git commit, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result):
+    """Print one case's phase timings"""
+    status = result['solver'].get('status')
+    print(f"{Colors.BLUE}{result['profile']}{Colors.END} roster of {result['size']} "
+          f"({result['constraints']} constraints, solver: {status})")
+    for phase, timing in result['phases'].items():
+        print(f"  {phase:<14} {timing['median'] * 1000:10.2f} ms  (min {timing['min'] * 1000:.2f} ms)")
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Return a list of (profile, size, phase, baseline_seconds, current_seconds) that got slower"""
+    previous = {(r['profile'], r['size']): r['phases'] for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        phases = previous.get((result['profile'], result['size']))
+        if phases is None:
+            continue
+        for phase, timing in result['phases'].items():
+            if phase not in phases:
+                continue
+            # The fastest run is the least affected by noise from the rest of the machine
+            before = phases[phase]['min']
+            after = timing['min']
+            if after > before * (1 + threshold) and after - before > MIN_REGRESSION_SECONDS:
+                regressions.append((result['profile'], result['size'], phase, before, after))
+    return regressions
+
+
+def parse_arguments():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark the gift exchange pipeline on synthetic rosters (offline)')
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')], default=DEFAULT_SIZES,
+                        help=f"Comma-separated roster sizes (default: {','.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--profiles', type=lambda value: value.split(','), default=DEFAULT_PROFILES,
+                        help=f"Comma-separated constraint profiles from {', '.join(PROFILES)} (default: {','.join(DEFAULT_PROFILES)})")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help=f'Runs per roster; the median is reported (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f'Random seed for rosters and assignments (default: {DEFAULT_SEED})')
+    parser.add_argument('--output', metavar='PATH', help='Write the results as JSON to PATH')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare against an earlier --output file and exit 1 if any phase got slower')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Relative slowdown that counts as a regression (default: {DEFAULT_THRESHOLD})')
+    args = parser.parse_args()
+    unknown = [profile for profile in args.profiles if profile not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)}")
+    return args
+
+
+def main():
+    args = parse_arguments()
+    main_module = load_main_module()
+
+    # Run every roster size and profile
+    results = []
+    for profile in args.profiles:
+        for size in args.sizes:
+            result = run_case(main_module, size, profile, args.repeat, args.seed)
+            print_result(result)
+            results.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"✅ Benchmark results written to {args.output}")
+
+    # Flag slowdowns against the baseline
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(baseline, report, args.threshold)
+        label = baseline.get('commit') or args.compare
+        if regressions:
+            print(f"❌ {len(regressions)} phase(s) got slower than {label}:")
+            for profile, size, phase, before, after in regressions:
+                print(f"  - {profile} roster of {size}, {phase}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({after / before:.2f}x)")
+            return 1
+        print(f"✅ No regressions compared to {label}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,162 @@
+"""
+On-disk cache for assignment files downloaded from S3.
+
+Files are stored content-addressed by bucket/key/ETag under the cache
+directory, with a small metadata file per bucket/key recording the current
+ETag and when it was last validated. Within the TTL a cached copy is used
+without touching the network; after that it is revalidated with a conditional
+GET (If-None-Match), so an unchanged file is never downloaded twice. The
+cache is bounded in size and evicts the least recently used files first.
+"""
+
+import hashlib
+import json
+import os
+import time
+from decouple import config
+from backends import storage_backend
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'xmas-xchange')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300  # seconds
+CHUNK_SIZE = 64 * 1024
+
+
+def _digest(*parts):
+    """Hash the given strings into a file-name-safe key"""
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    """Write data to path without ever leaving a partial file behind"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+
+def is_not_modified(error):
+    """Return True if a boto3 error is the 304 answer to a conditional GET"""
+    response = getattr(error, 'response', None) or {}
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    code = response.get('Error', {}).get('Code')
+    return status == 304 or code in ('304', 'NotModified')
+
+
+class AssignmentCache:
+    """Size-bounded LRU cache of S3 objects keyed by bucket/key/ETag"""
+
+    def __init__(self, directory=None, max_bytes=None, ttl=None):
+        if directory is None:
+            # Local storage backends are already on this machine, so only cache S3
+            directory = config('ASSIGNMENT_CACHE_DIR', default=DEFAULT_CACHE_DIR) if storage_backend() == 's3' else ''
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else config('ASSIGNMENT_CACHE_MAX_BYTES', default=DEFAULT_MAX_BYTES, cast=int)
+        self.ttl = ttl if ttl is not None else config('ASSIGNMENT_CACHE_TTL', default=DEFAULT_TTL, cast=float)
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    def _meta_path(self, bucket_name, key):
+        return os.path.join(self.directory, 'meta', f"{_digest(bucket_name, key)}.json")
+
+    def _blob_path(self, bucket_name, key, etag):
+        return os.path.join(self.directory, 'blobs', _digest(bucket_name, key, etag))
+
+    def _load_meta(self, bucket_name, key):
+        """Return the metadata for bucket/key if its cached blob still exists"""
+        try:
+            with open(self._meta_path(bucket_name, key)) as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(self._blob_path(bucket_name, key, meta['etag'])) else None
+
+    def _use_blob(self, bucket_name, key, etag):
+        """Mark a cached blob as recently used and return its path"""
+        path = self._blob_path(bucket_name, key, etag)
+        os.utime(path)
+        return path
+
+    def _download(self, bucket_name, key, response):
+        """Stream a GetObject response body into the cache and return the blob path"""
+        os.makedirs(os.path.join(self.directory, 'meta'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'blobs'), exist_ok=True)
+        etag = response.get('ETag', '')
+        path = self._blob_path(bucket_name, key, etag)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        body = response['Body']
+        with open(temp_path, 'wb') as blob_file:
+            for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+                blob_file.write(chunk)
+        os.replace(temp_path, path)
+        self._touch_meta(bucket_name, key, etag)
+        self.evict(keep=path)
+        return path
+
+    def _touch_meta(self, bucket_name, key, etag):
+        meta = {'bucket': bucket_name, 'key': key, 'etag': etag, 'validated_at': time.time()}
+        _write_atomic(self._meta_path(bucket_name, key), json.dumps(meta).encode('utf-8'))
+
+    def fresh_path(self, bucket_name, key):
+        """Return the cached file path for bucket/key if it was validated within the TTL, else None"""
+        if not self.enabled:
+            return None
+        meta = self._load_meta(bucket_name, key)
+        if meta is None or time.time() - meta['validated_at'] > self.ttl:
+            return None
+        return self._use_blob(bucket_name, key, meta['etag'])
+
+    def path(self, s3_client, bucket_name, key):
+        """Return a local file path with the object's bytes, downloading only if the cached copy is missing or stale"""
+        fresh = self.fresh_path(bucket_name, key)
+        if fresh is not None:
+            return fresh
+
+        meta = self._load_meta(bucket_name, key)
+        request = {'Bucket': bucket_name, 'Key': key}
+        if meta is not None:
+            request['IfNoneMatch'] = meta['etag']
+        try:
+            response = s3_client.get_object(**request)
+        except Exception as e:
+            if meta is not None and is_not_modified(e):
+                self._touch_meta(bucket_name, key, meta['etag'])
+                return self._use_blob(bucket_name, key, meta['etag'])
+            raise
+        return self._download(bucket_name, key, response)
+
+    def open(self, s3_client, bucket_name, key):
+        """Return a readable binary stream of the object, from the cache when it is enabled"""
+        if not self.enabled:
+            return s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+        return open(self.path(s3_client, bucket_name, key), 'rb')
+
+    def get(self, s3_client, bucket_name, key):
+        """Return the bytes of an S3 object, downloading it only if the cached copy is missing or stale"""
+        stream = self.open(s3_client, bucket_name, key)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
+    def evict(self, keep=None):
+        """Delete the least recently used blobs (except keep) until the cache fits in max_bytes"""
+        blob_dir = os.path.join(self.directory, 'blobs')
+        try:
+            entries = [entry for entry in os.scandir(blob_dir) if entry.is_file()]
+        except OSError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.path == keep:
+                continue
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
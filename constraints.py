@@ -0,0 +1,93 @@
+"""
+Compiled constraint index shared by the generator, the validators and the
+feasibility checks.
+
+Participants are mapped to integer ids once per run. Forbidden recipients are
+kept as frozensets of ids (and the reverse, who forbids each person) for O(1)
+pair checks in the solver's inner loop and the feasibility checks.
+"""
+
+
+class ConstraintIndex:
+    """Participants mapped to integer ids with their forbidden recipients precompiled"""
+
+    def __init__(self, people, constraints):
+        self.people = list(people)
+        self.ids = {person: i for i, person in enumerate(self.people)}
+        self.forbidden = []
+        self.unknown = {}
+        forbidden_by = [set() for _ in self.people]
+
+        for giver, person in enumerate(self.people):
+            excluded = set()
+            for name in constraints.get(person, []):
+                recipient = self.ids.get(name)
+                if recipient is None:
+                    # Constraint on someone who isn't in the roster (typo or removed person)
+                    self.unknown.setdefault(person, []).append(name)
+                elif recipient != giver:
+                    excluded.add(recipient)
+            self.forbidden.append(frozenset(excluded))
+            for recipient in excluded:
+                forbidden_by[recipient].add(giver)
+
+        self.forbidden_by = [frozenset(givers) for givers in forbidden_by]
+
+    @classmethod
+    def from_roster(cls, roster):
+        """Build the index from a roster.Roster"""
+        return cls(roster.names, roster.constraints())
+
+    def __len__(self):
+        return len(self.people)
+
+    def allows_id(self, giver_id, recipient_id):
+        """Return True if giver_id may give to recipient_id"""
+        return giver_id != recipient_id and recipient_id not in self.forbidden[giver_id]
+
+    def allows(self, giver, recipient):
+        """Return True if giver may give to recipient (unknown names are never allowed)"""
+        giver_id = self.ids.get(giver)
+        recipient_id = self.ids.get(recipient)
+        if giver_id is None or recipient_id is None:
+            return False
+        return self.allows_id(giver_id, recipient_id)
+
+    def reachable_from(self, source, reverse=False, within=None):
+        """
+        Return the set of ids reachable from source over allowed edges.
+
+        With reverse=True the edges are followed backwards (who can reach source).
+        within restricts the walk to a subset of ids. Walking the complement of
+        the forbidden sets costs O(n + total constraints) rather than touching
+        every allowed edge.
+        """
+        blocked = self.forbidden_by if reverse else self.forbidden
+        candidates = range(len(self.people)) if within is None else within
+        unreached = [u for u in candidates if u != source]
+        reached = {source}
+        queue = [source]
+        while queue and unreached:
+            excluded = blocked[queue.pop()]
+            still_unreached = []
+            for v in unreached:
+                if v in excluded:
+                    still_unreached.append(v)
+                else:
+                    reached.add(v)
+                    queue.append(v)
+            unreached = still_unreached
+        return reached
+
+    def check(self, assignment):
+        """Return True if no pair in assignment breaks a constraint"""
+        ids = self.ids
+        forbidden = self.forbidden
+        for person, recipient in assignment.items():
+            giver_id = ids.get(person)
+            recipient_id = ids.get(recipient)
+            if giver_id is None or recipient_id is None:
+                continue
+            if giver_id == recipient_id or recipient_id in forbidden[giver_id]:
+                return False
+        return True
@@ -0,0 +1,127 @@
+"""
+Concurrent, rate-limited SMS dispatch.
+
+Messages are sent from a small thread pool. A shared token bucket keeps the
+overall send rate under the Twilio throughput cap for the sending number, and
+requests that fail with a 429 or 5xx status are retried with exponential
+backoff. Every message ends up with a result record that can be written out as
+a JSON report.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from metrics import metrics
+
+# Defaults can be overridden in .env
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RATE_LIMIT = 1.0  # messages per second (Twilio long code numbers allow 1 MPS)
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF = 1.0  # seconds before the first retry, doubled each time
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    """Return True if a Twilio error is worth retrying (throttled or server-side)"""
+    status = getattr(error, 'status', None)
+    return status in RETRYABLE_STATUSES
+
+
+class SmsDispatcher:
+    """Send many SMS messages concurrently through one Twilio client"""
+
+    def __init__(self, twilio_client, from_number=None, max_workers=None, rate_limit=None,
+                 max_retries=None, backoff=None):
+        self.twilio_client = twilio_client
+        self.from_number = from_number or config('TWILIO_PHONE_NUMBER')
+        self.max_workers = max_workers or config('SMS_MAX_WORKERS', default=DEFAULT_MAX_WORKERS, cast=int)
+        if rate_limit is None:
+            rate_limit = config('SMS_RATE_LIMIT', default=DEFAULT_RATE_LIMIT, cast=float)
+        self.max_retries = max_retries if max_retries is not None else config('SMS_MAX_RETRIES', default=DEFAULT_MAX_RETRIES, cast=int)
+        self.backoff = backoff if backoff is not None else config('SMS_RETRY_BACKOFF', default=DEFAULT_BACKOFF, cast=float)
+        # A rate limit of 0 (or less) means no limit, e.g. for the local SMS backends
+        self.bucket = TokenBucket(rate_limit, capacity=max(1, int(rate_limit))) if rate_limit > 0 else None
+
+    def send_one(self, job):
+        """Send one message with retries and return its result record"""
+        result = {'person': job['person'], 'to': job['to'], 'status': 'failed', 'sid': None, 'attempts': 0, 'error': None}
+        if 'exchange' in job:
+            result['exchange'] = job['exchange']
+        delay = self.backoff
+        while True:
+            if self.bucket is not None:
+                with metrics.timer('sms.rate_limit_wait'):
+                    self.bucket.acquire()
+            result['attempts'] += 1
+            try:
+                with metrics.timer('twilio.messages.create'):
+                    response = self.twilio_client.messages.create(to=job['to'], from_=self.from_number, body=job['body'])
+                result['status'] = 'sent'
+                result['sid'] = getattr(response, 'sid', None)
+                result['error'] = None
+                return result
+            except Exception as e:
+                result['error'] = str(e)
+                if not is_retryable(e) or result['attempts'] > self.max_retries:
+                    return result
+                metrics.count('sms_retries')
+            # Jitter keeps the workers from retrying in lockstep
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    def send_all(self, jobs, before_send=None, after_send=None):
+        """
+        Send every job ({'person', 'to', 'body'}) and return the results in the same order.
+
+        before_send(job) and after_send(result) are called from the worker
+        threads around each message, e.g. to journal its progress.
+        """
+        def send(job):
+            if before_send:
+                before_send(job)
+            result = self.send_one(job)
+            if after_send:
+                after_send(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(send, jobs))
+
+
+def write_report(results, path):
+    """Write the per-message results to a JSON report file"""
+    summary = {
+        'sent': sum(1 for r in results if r['status'] == 'sent'),
+        'failed': sum(1 for r in results if r['status'] != 'sent'),
+        'messages': results,
+    }
+    with open(path, 'w') as report_file:
+        json.dump(summary, report_file, indent=2)
@@ -0,0 +1,192 @@
+"""
+Polynomial-time pre-flight checks for the gift exchange constraints.
+
+A single gift cycle needs (1) everyone to have at least one allowed recipient
+and giver, (2) a perfect matching between givers and recipients (Hall's
+condition) and (3) an allowed-recipient graph where everyone can reach everyone
+else. These are necessary conditions only: finding a Hamiltonian cycle is
+NP-complete, so a roster can pass every check here and still be rejected by the
+solver, but in practice almost every bad json/data.json fails one of them.
+"""
+
+import random
+from collections import deque
+
+# Cap on how many names are printed for a single problem
+MAX_NAMES = 10
+
+
+def _names(index, ids, hide_names):
+    """Format a group of ids for a problem description"""
+    if hide_names:
+        return f"{len(ids)} {'person' if len(ids) == 1 else 'people'}"
+    names = sorted(index.people[i] for i in ids)
+    if len(names) > MAX_NAMES:
+        return ', '.join(names[:MAX_NAMES]) + f" and {len(names) - MAX_NAMES} more"
+    return ', '.join(names)
+
+
+def _take(remaining, position, v):
+    """Swap-remove id v from the remaining list"""
+    i = position[v]
+    last = remaining.pop()
+    if last != v:
+        remaining[i] = last
+        position[last] = i
+
+
+def _alternating_search(index, roots, matched_by):
+    """
+    Breadth-first search along alternating paths from the unmatched givers in roots.
+
+    Returns (end, parent, givers): end is a free recipient that can be reached
+    (None if there is none), parent maps each visited recipient to the giver it
+    was reached from, and givers is every giver visited along the way.
+    """
+    forbidden = index.forbidden
+    parent = {}
+    unvisited = list(range(len(index)))
+    queue = deque(roots)
+    givers = set(roots)
+    while queue:
+        giver = queue.popleft()
+        excluded = forbidden[giver]
+        still_unvisited = []
+        for r in unvisited:
+            if r == giver or r in excluded:
+                still_unvisited.append(r)
+                continue
+            parent[r] = giver
+            if matched_by[r] is None:
+                return r, parent, givers
+            givers.add(matched_by[r])
+            queue.append(matched_by[r])
+        unvisited = still_unvisited
+    return None, parent, givers
+
+
+def find_matching(index, rng=None):
+    """
+    Find a maximum giver -> recipient matching over allowed edges.
+
+    Returns (match, hall_violator). match[giver] is the recipient id or None.
+    hall_violator is None when everyone is matched, otherwise a (givers,
+    recipients) pair of id sets where the givers can only reach fewer
+    recipients than there are givers.
+    """
+    rng = rng or random
+    n = len(index)
+    forbidden = index.forbidden
+    match = [None] * n
+    matched_by = [None] * n
+
+    # Greedy start: most constrained givers first, random probes for a free recipient
+    free = list(range(n))
+    position = list(range(n))
+    for giver in sorted(range(n), key=lambda u: -len(forbidden[u])):
+        excluded = forbidden[giver]
+        chosen = None
+        for _ in range(4):
+            if not free:
+                break
+            r = free[rng.randrange(len(free))]
+            if r != giver and r not in excluded:
+                chosen = r
+                break
+        if chosen is None:
+            chosen = next((r for r in free if r != giver and r not in excluded), None)
+        if chosen is not None:
+            match[giver] = chosen
+            matched_by[chosen] = giver
+            _take(free, position, chosen)
+
+    # Augment each unmatched giver; one that fails now can never be matched later
+    unmatched = []
+    for root in range(n):
+        if match[root] is not None:
+            continue
+        end, parent, _ = _alternating_search(index, [root], matched_by)
+        if end is None:
+            unmatched.append(root)
+            continue
+        r = end
+        while r is not None:
+            giver = parent[r]
+            previous = match[giver]
+            match[giver] = r
+            matched_by[r] = giver
+            r = previous
+
+    if not unmatched:
+        return match, None
+
+    # Everyone reachable from the unmatched givers is the largest Hall violator
+    _, parent, givers = _alternating_search(index, unmatched, matched_by)
+    return match, (givers, set(parent))
+
+
+def strongly_connected_groups(index):
+    """Split everyone into groups that can all reach each other through allowed edges"""
+    remaining = set(range(len(index)))
+    groups = []
+    while remaining:
+        source = next(iter(remaining))
+        forward = index.reachable_from(source, within=remaining)
+        backward = index.reachable_from(source, reverse=True, within=remaining)
+        group = forward & backward
+        groups.append(group)
+        remaining -= group
+    return groups
+
+
+def check_feasibility(index, hide_names=False):
+    """Return a list of problems that make a single gift cycle impossible (empty if none found)"""
+    n = len(index)
+    if n < 2:
+        return [f"At least 2 people are needed for a gift exchange (found {n})."]
+
+    problems = []
+
+    no_recipients = [u for u in range(n) if len(index.forbidden[u]) >= n - 1]
+    if no_recipients:
+        problems.append(f"Excluded everyone else and have nobody to give to: {_names(index, no_recipients, hide_names)}")
+
+    no_givers = [w for w in range(n) if len(index.forbidden_by[w]) >= n - 1]
+    if no_givers:
+        problems.append(f"Excluded by everyone else and can't receive a gift: {_names(index, no_givers, hide_names)}")
+
+    if problems:
+        return problems
+
+    _, hall_violator = find_matching(index)
+    if hall_violator is not None:
+        givers, recipients = hall_violator
+        problems.append(
+            f"{len(givers)} givers can only give to {len(recipients)} "
+            f"recipient{'' if len(recipients) == 1 else 's'} between them: "
+            f"{_names(index, givers, hide_names)}"
+        )
+
+    groups = strongly_connected_groups(index)
+    if len(groups) > 1:
+        groups.sort(key=len)
+        problems.append(
+            f"Constraints split the roster into {len(groups)} groups that can't be joined in one gift cycle:"
+        )
+        for group in groups[:MAX_NAMES]:
+            problems.append(f"  group of {len(group)}: {_names(index, group, hide_names)}")
+        if len(groups) > MAX_NAMES:
+            problems.append(f"  ... and {len(groups) - MAX_NAMES} more groups")
+
+    return problems
+
+
+def constraint_warnings(index, hide_names=False):
+    """Return warnings about constraints naming people who aren't in the roster"""
+    warnings = []
+    for person, names in index.unknown.items():
+        if hide_names:
+            warnings.append(f"A participant has {len(names)} constraint(s) on unknown people")
+        else:
+            warnings.append(f"{person} has constraints on unknown people: {', '.join(names)}")
+    return warnings
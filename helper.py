@@ -1,11 +1,37 @@
 #!/usr/bin/env python3
+import startup  # first, so --startup-report can time the imports below
 import argparse
-import boto3
+import gzip
+import importlib.util
+import os
+import json
 import re
-import io
+import sys
+import tempfile
+from contextlib import closing, redirect_stdout
 from datetime import datetime
 from decouple import config
-from twilio.rest import Client
+from archive import upload_index, fetch_recipient, is_not_found
+from cache import AssignmentCache, CHUNK_SIZE
+from backends import storage_backend, sms_backend, create_local_storage, create_local_sms_client
+from metrics import metrics
+
+# Seconds to wait for S3 or Twilio to answer before giving up on a request
+DEFAULT_CONNECTION_TIMEOUT = 10
+
+# Assignment file names, with an optional repair version: "<date>_gift_assignments[_v2][_dryrun].txt[.gz]"
+ASSIGNMENT_FILE_NAME = re.compile(r'^(.*?)(?:_v(\d+))?(?:_dryrun)?\.txt(?:\.gz)?$')
+
+# New assignment files are written gzip-compressed; files from before that are plain .txt
+ASSIGNMENT_FILE_SUFFIX = '.txt.gz'
+COMPRESSED_SUFFIX = '.gz'
+GZIP_LEVEL = 6
+
+# Compressed assignment data is kept in memory up to this size, then spills to a temporary file
+UPLOAD_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Lines in the assignment file that hold an assignment: "Person -> Recipient"
+ASSIGNMENT_LINE = re.compile(r'^(\w+)\s*->\s*(\w+)$')
 
 # ANSI color constants
 class Colors:
@@ -20,23 +46,52 @@ class Colors:
     END = '\033[0m'
 
 def setup_s3_client():
-    """Setup and return S3 client using environment variables"""
+    """Setup and return S3 client (or the configured local storage backend) using environment variables"""
+    backend = storage_backend()
+    if backend != 's3':
+        return metrics.instrument(create_local_storage(backend), 's3')
+    
+    # Imported here so commands that never talk to S3 don't pay for loading the SDK
+    import boto3
+    from botocore.config import Config as BotoConfig
+    
     aws_access_key_id = config('AWS_ACCESS_KEY_ID')
     aws_secret_access_key = config('AWS_SECRET_ACCESS_KEY')
     aws_region = config('AWS_REGION')
+    timeout = config('CONNECTION_TIMEOUT', default=DEFAULT_CONNECTION_TIMEOUT, cast=float)
     
-    return boto3.client(
+    client = boto3.client(
         's3',
         aws_access_key_id=aws_access_key_id,
         aws_secret_access_key=aws_secret_access_key,
-        region_name=aws_region
+        region_name=aws_region,
+        config=BotoConfig(connect_timeout=timeout, read_timeout=timeout)
     )
+    
+    # Record the latency of every S3 call for --metrics-json
+    return metrics.instrument(client, 's3')
 
 def setup_twilio_client():
-    """Setup and return Twilio client using environment variables"""
+    """Setup and return Twilio client (or the configured local SMS backend) using environment variables"""
+    backend = sms_backend()
+    if backend != 'twilio':
+        return create_local_sms_client(backend)
+    
+    # Imported here so commands that never talk to Twilio don't pay for loading the SDK
+    from twilio.rest import Client
+    from twilio.http.http_client import TwilioHttpClient
+    
     account_sid = config('TWILIO_ACCOUNT_SID')
     auth_token = config('TWILIO_AUTH_TOKEN')
-    return Client(account_sid, auth_token)
+    timeout = config('CONNECTION_TIMEOUT', default=DEFAULT_CONNECTION_TIMEOUT, cast=float)
+    client = Client(account_sid, auth_token, http_client=TwilioHttpClient(timeout=timeout))
+    
+    # Point the REST API at another host (e.g. a local fake Twilio server for tests)
+    api_base_url = config('TWILIO_API_BASE_URL', default='')
+    if api_base_url:
+        client.api.base_url = api_base_url
+    
+    return client
 
 def test_s3_connection(s3_client):
     """Test S3 connection and return True if successful"""
@@ -49,91 +104,257 @@ def test_s3_connection(s3_client):
         print(f"❌ S3 connection failed: {e}")
         return False
 
-def test_twilio_connection():
-    """Test Twilio connection and return True if successful"""
+def test_twilio_connection(twilio_client=None):
+    """Test Twilio connection (with twilio_client, or a new client) and return True if successful"""
     try:
-        client = setup_twilio_client()
-        account_sid = config('TWILIO_ACCOUNT_SID')
-        client.api.accounts.get(account_sid)
+        client = twilio_client or setup_twilio_client()
+        account_sid = config('TWILIO_ACCOUNT_SID', default='')
+        with metrics.timer('twilio.accounts.fetch'):
+            client.api.accounts.get(account_sid).fetch()
         print("✅ Twilio connection successful!")
         return True
     except Exception as e:
         print(f"❌ Twilio connection failed: {e}")
         return False
 
-def upload_assignment_data_to_s3(s3_client, assignment_data, is_dry_run=False, is_github_test=False):
-    """Upload assignment data to S3 with appropriate filename"""
-    bucket_name = config('S3_BUCKET')
-    
-    # Create a BytesIO object
-    file_object = io.BytesIO(assignment_data.encode())
-    
-    # Generate filename
+def next_version_file_name(file_name, is_dry_run=False):
+    """Return the file name for the next repaired version of an assignment file"""
+    match = ASSIGNMENT_FILE_NAME.match(file_name)
+    base, version = match.groups() if match else (file_name, None)
+    file_suffix = '_dryrun' if is_dry_run else ''
+    return f"{base}_v{int(version or 1) + 1}{file_suffix}{ASSIGNMENT_FILE_SUFFIX}"
+
+def assignment_file_name(is_dry_run=False, is_github_test=False, prefix=''):
+    """Return a new timestamped assignment file name (prefix is prepended, e.g. a folder per exchange)"""
     current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     file_prefix = 'github_' if is_github_test else ''
     file_suffix = '_dryrun' if is_dry_run or is_github_test else ''
-    file_name = f"{file_prefix}{current_datetime}_gift_assignments{file_suffix}.txt"
+    return f"{prefix}{file_prefix}{current_datetime}_gift_assignments{file_suffix}{ASSIGNMENT_FILE_SUFFIX}"
+
+def write_assignment_data(assignment_data, file_object, compress=True):
+    """Write assignment data (a string or an iterable of strings) to a binary file, gzipped if compress, and return the uncompressed size"""
+    if isinstance(assignment_data, str):
+        assignment_data = [assignment_data]
+    size = 0
+    writer = gzip.GzipFile(fileobj=file_object, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) if compress else file_object
+    try:
+        for chunk in assignment_data:
+            data = chunk.encode()
+            writer.write(data)
+            size += len(data)
+    finally:
+        if compress:
+            writer.close()
+    return size
+
+def upload_assignment_data_to_s3(s3_client, assignment_data, is_dry_run=False, is_github_test=False, assignment=None, file_name=None):
+    """
+    Upload assignment data to S3 with appropriate filename (or file_name), plus a per-person index if assignment is given.
+
+    assignment_data can be a string or an iterable of strings (e.g. a generator
+    yielding one person at a time). It is gzipped as it is written (unless
+    file_name is a plain .txt file) into a spooled temporary file, so memory
+    stays bounded, and boto3 switches to a multipart upload for large files.
+    """
+    bucket_name = config('S3_BUCKET')
+    
+    # Generate filename
+    if file_name is None:
+        file_name = assignment_file_name(is_dry_run, is_github_test)
     
     # Upload file object to S3
-    s3_client.upload_fileobj(file_object, bucket_name, file_name)
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES) as file_object:
+        size = write_assignment_data(assignment_data, file_object, file_name.endswith(COMPRESSED_SUFFIX))
+        uploaded = file_object.tell()
+        file_object.seek(0)
+        s3_client.upload_fileobj(file_object, bucket_name, file_name)
+    metrics.count('s3_bytes_uploaded', uploaded)
+    metrics.count('assignment_file_bytes', size)
+    
+    # Upload the per-person index so single lookups don't need the whole file
+    if assignment:
+        upload_index(s3_client, bucket_name, file_name, assignment)
     
     return file_name
 
+def load_main_module():
+    """Import xmas-xchange.py (its file name isn't a valid module name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xmas-xchange.py')
+    spec = importlib.util.spec_from_file_location('xmas_xchange', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class _GzipReader(gzip.GzipFile):
+    """GzipFile that also closes the stream it decompresses"""
+
+    def close(self):
+        source = self.fileobj
+        super().close()
+        if source is not None:
+            source.close()
+
+def decompressed(stream, file_name):
+    """Return a binary stream of the text of an assignment file, decompressing it if it is gzipped"""
+    if file_name.endswith(COMPRESSED_SUFFIX):
+        return _GzipReader(fileobj=stream, mode='rb')
+    return stream
+
+def open_assignment_file(s3_client, bucket_name, file_name):
+    """Return a binary stream of an assignment file's text from the local cache or straight from S3"""
+    return decompressed(AssignmentCache().open(s3_client, bucket_name, file_name), file_name)
+
+def iter_lines(stream, chunk_size=CHUNK_SIZE):
+    """Yield decoded lines from a binary stream, reading it incrementally"""
+    pending = b''
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8')
+    if pending:
+        yield pending.decode('utf-8')
+
+def iter_assignments(lines):
+    """Yield (person, recipient) pairs from lines in the format "Person -> Recipient" """
+    for line in lines:
+        # Only the assignment lines contain an arrow, so skip everything else cheaply
+        if '->' not in line:
+            continue
+        match = ASSIGNMENT_LINE.match(line.rstrip('\r'))
+        if match:
+            yield match.groups()
+
 def get_assignment_file_content(s3_client, bucket_name, file_name):
-    """Download and return the content of an assignment file from S3"""
+    """Download and return the content of an assignment file from S3 (or the local cache)"""
     try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=file_name)
-        return response['Body'].read().decode('utf-8')
+        with closing(open_assignment_file(s3_client, bucket_name, file_name)) as stream:
+            return stream.read().decode('utf-8')
     except Exception as e:
         print(f"Error downloading file {file_name}: {e}")
         return None
 
+def stream_assignments(s3_client, bucket_name, file_name, person_names=None):
+    """
+    Stream an assignment file and return a dict of person -> recipient.
+
+    With person_names, only those people are kept and reading stops as soon as
+    all of them have been found. Returns None if the file can't be read.
+    """
+    wanted = set(person_names) if person_names is not None else None
+    assignments = {}
+    try:
+        with closing(open_assignment_file(s3_client, bucket_name, file_name)) as stream:
+            for person, recipient in iter_assignments(iter_lines(stream)):
+                if wanted is None:
+                    assignments[person] = recipient
+                elif person in wanted:
+                    assignments[person] = recipient
+                    if len(assignments) == len(wanted):
+                        break
+    except Exception as e:
+        print(f"Error downloading file {file_name}: {e}")
+        return None
+    return assignments
+
 def parse_assignments(content):
     """Parse assignment content and return a dictionary of person -> recipient"""
-    assignments = {}
-    lines = content.split('\n')
+    return dict(iter_assignments(content.split('\n')))
+
+def query_assignments(file_name, person_names=None, s3_client=None):
+    """
+    Look up many people in one assignment file with a single connection check and download.
+
+    Returns a dict of person -> recipient (None for people not in the file), covering
+    everyone in the file when person_names is None. Returns None if the file can't be read.
+    """
+    bucket_name = config('S3_BUCKET')
+    if s3_client is None and AssignmentCache().fresh_path(bucket_name, file_name) is None:
+        s3_client = setup_s3_client()
+        if not test_s3_connection(s3_client):
+            return None
     
-    for line in lines:
-        # Look for lines in format "Person -> Recipient"
-        match = re.match(r'^(\w+)\s*->\s*(\w+)$', line)
-        if match:
-            person, recipient = match.groups()
-            assignments[person] = recipient
+    assignments = stream_assignments(s3_client, bucket_name, file_name, person_names)
+    if assignments is None or person_names is None:
+        return assignments
+    return {person: assignments.get(person) for person in person_names}
+
+def query_person(file_name, person_name):
+    """Look up and print one person's assignment, returning the exit code"""
+    bucket_name = config('S3_BUCKET')
+    s3_client = None
     
-    return assignments
+    # Without a recently validated cached copy, go to S3
+    if AssignmentCache().fresh_path(bucket_name, file_name) is None:
+        # Setup S3 client and test connection
+        s3_client = setup_s3_client()
+        if not test_s3_connection(s3_client):
+            return 1
+        
+        # Look up the person through the file's index with a couple of small Range GETs
+        try:
+            recipient = fetch_recipient(s3_client, bucket_name, file_name, person_name)
+        except Exception as e:
+            if not is_not_found(e):
+                print(f"Error reading the index of {file_name}: {e}")
+                return 1
+            recipient = None  # Older files have no index
+        if recipient is not None:
+            print(f"{person_name} -> {recipient}")
+            return 0
+    
+    # Stream the assignment file, stopping as soon as the person is found
+    people = []
+    try:
+        with closing(open_assignment_file(s3_client, bucket_name, file_name)) as stream:
+            for person, recipient in iter_assignments(iter_lines(stream)):
+                if person == person_name:
+                    print(f"{person_name} -> {recipient}")
+                    return 0
+                people.append(person)
+    except Exception as e:
+        print(f"Error downloading file {file_name}: {e}")
+        return 1
+    
+    print(f"Person '{person_name}' not found in assignments.")
+    print("Available people:")
+    for person in sorted(people):
+        print(f"  - {person}")
+    return 1
 
 def main():
     parser = argparse.ArgumentParser(description='Query gift exchange assignments from S3')
-    parser.add_argument('file_name', help='Name of the assignment file in S3 (e.g., 2024-12-01_12-00-00_gift_assignments.txt)')
-    parser.add_argument('person_name', help='Name of the person to query')
+    parser.add_argument('file_name', help='Name of the assignment file in S3 (e.g., 2024-12-01_12-00-00_gift_assignments.txt.gz)')
+    parser.add_argument('person_names', nargs='*', metavar='person_name', help='Name of the person (or people) to query')
+    parser.add_argument('--all', action='store_true', help='Query everyone in the assignment file')
+    parser.add_argument('--json', action='store_true', help='Print the results as a JSON object of person -> recipient')
+    parser.add_argument(startup.STARTUP_REPORT_FLAG, action='store_true', help='Print how long each module took to import to stderr when done')
     
     args = parser.parse_args()
+    if not args.person_names and not args.all:
+        parser.error('give at least one person_name or use --all')
     
-    # Setup S3 client and test connection
-    s3_client = setup_s3_client()
-    if not test_s3_connection(s3_client):
-        return 1
+    # A single person keeps the fast indexed lookup
+    if len(args.person_names) == 1 and not args.all and not args.json:
+        return query_person(args.file_name, args.person_names[0])
     
-    # Download and parse the assignment file
-    bucket_name = config('S3_BUCKET')
-    content = get_assignment_file_content(s3_client, bucket_name, args.file_name)
-    if content is None:
+    # Keep stdout clean for JSON output by sending the connection check messages to stderr
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        results = query_assignments(args.file_name, None if args.all else args.person_names)
+    if results is None:
         return 1
     
-    assignments = parse_assignments(content)
-    
-    # Look up the person's assignment
-    if args.person_name in assignments:
-        recipient = assignments[args.person_name]
-        print(f"{args.person_name} -> {recipient}")
+    missing = sorted(person for person, recipient in results.items() if recipient is None)
+    if args.json:
+        print(json.dumps(results, indent=2))
     else:
-        print(f"Person '{args.person_name}' not found in assignments.")
-        print("Available people:")
-        for person in sorted(assignments.keys()):
-            print(f"  - {person}")
-        return 1
+        for person, recipient in results.items():
+            if recipient is not None:
+                print(f"{person} -> {recipient}")
+        for person in missing:
+            print(f"Person '{person}' not found in assignments.")
     
-    return 0
+    return 1 if missing else 0
 
 if __name__ == '__main__':
     exit(main())
\ No newline at end of file
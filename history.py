@@ -0,0 +1,152 @@
+"""
+Pairing history index.
+
+Instead of listing and downloading every old assignment file, a small JSON
+index in the bucket (history/pairings.json) keeps who gave to whom in each
+year's real (non dry-run) exchange:
+
+    {"format": "xmas-xchange-history", "version": 1,
+     "last_key": "2024-12-01_12-00-00_gift_assignments.txt.gz",
+     "years": {"2024": {"file": "...", "pairs": {"Adam": "Carole", ...}}}}
+
+It is updated after every real run. Assignment files that were written
+without updating it (for example before it existed) are picked up by listing
+only the keys after last_key, so each run lists at most the files that are new
+since the previous one. Reads go through the local assignment cache and are
+revalidated with a conditional GET.
+"""
+
+import io
+import json
+import re
+from datetime import datetime
+from decouple import config
+from archive import is_not_found
+from cache import AssignmentCache
+from helper import stream_assignments
+from metrics import metrics
+
+HISTORY_KEY = 'history/pairings.json'
+FORMAT_NAME = 'xmas-xchange-history'
+FORMAT_VERSION = 1
+
+# Real assignment files: "<date>_<time>_gift_assignments[_v<N>].txt[.gz]" (dry runs and GitHub tests are skipped)
+REAL_ASSIGNMENT_FILE = re.compile(r'^(\d{4})-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}_gift_assignments(?:_v(\d+))?\.txt(?:\.gz)?$')
+
+
+def empty_history():
+    return {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'last_key': None, 'years': {}}
+
+
+def _file_order(file_name):
+    """Sort key for real assignment files: run time, then repair version"""
+    match = REAL_ASSIGNMENT_FILE.match(file_name)
+    return file_name[:19], int(match.group(2) or 1)
+
+
+def load_history(s3_client, bucket_name):
+    """Return the history index from the bucket, or an empty one if there is none yet"""
+    try:
+        # ttl=0: always revalidate, an unchanged index is a cheap 304
+        data = AssignmentCache(ttl=0).get(s3_client, bucket_name, HISTORY_KEY)
+    except Exception as e:
+        if is_not_found(e):
+            return empty_history()
+        raise
+    history = json.loads(data)
+    if history.get('format') != FORMAT_NAME or history.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported history index format: {history.get('format')} v{history.get('version')}")
+    return history
+
+
+def save_history(s3_client, bucket_name, history):
+    """Upload the history index to the bucket"""
+    data = json.dumps(history, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    s3_client.upload_fileobj(io.BytesIO(data), bucket_name, HISTORY_KEY)
+    metrics.count('s3_bytes_uploaded', len(data))
+
+
+def add_assignment(history, file_name, assignment):
+    """
+    Record a real assignment file in the history and return True if it changed.
+
+    The latest file (or repair version) of each year replaces earlier ones,
+    since that is the assignment that stood.
+    """
+    match = REAL_ASSIGNMENT_FILE.match(file_name)
+    if not match:
+        return False
+    if history['last_key'] is None or file_name > history['last_key']:
+        history['last_key'] = file_name
+    year = match.group(1)
+    current = history['years'].get(year)
+    if current is not None and _file_order(current['file']) >= _file_order(file_name):
+        return False
+    history['years'][year] = {'file': file_name, 'pairs': dict(assignment)}
+    return True
+
+
+def list_new_assignment_files(s3_client, bucket_name, start_after=None):
+    """Yield real assignment file keys that sort after start_after, following S3 pagination"""
+    request = {'Bucket': bucket_name}
+    if start_after:
+        request['StartAfter'] = start_after
+    while True:
+        response = s3_client.list_objects_v2(**request)
+        for item in response.get('Contents', []):
+            key = item['Key']
+            # Assignment files start with the date and keys are listed in order, so
+            # the first key that doesn't (github_..., history/, journals/) ends them
+            if not key[:1].isdigit():
+                return
+            if REAL_ASSIGNMENT_FILE.match(key):
+                yield key
+        if not response.get('IsTruncated'):
+            return
+        request['ContinuationToken'] = response['NextContinuationToken']
+
+
+def sync_history(s3_client, bucket_name, history):
+    """Add any assignment files written since the index was last updated and return how many were read"""
+    added = 0
+    for key in list_new_assignment_files(s3_client, bucket_name, history['last_key']):
+        assignment = stream_assignments(s3_client, bucket_name, key)
+        if assignment:
+            add_assignment(history, key, assignment)
+            added += 1
+        elif history['last_key'] is None or key > history['last_key']:
+            history['last_key'] = key
+    return added
+
+
+def update_history(s3_client, file_name, assignment):
+    """Add a finished run to the bucket's history index (failures are reported, not raised)"""
+    bucket_name = config('S3_BUCKET')
+    try:
+        history = load_history(s3_client, bucket_name)
+        sync_history(s3_client, bucket_name, history)
+        add_assignment(history, file_name, assignment)
+        save_history(s3_client, bucket_name, history)
+    except Exception as e:
+        print(f"⚠️  Could not update the pairing history: {e}")
+
+
+def past_recipients(history, years, current_year=None):
+    """Return giver -> set of recipients from the `years` years before current_year"""
+    current_year = current_year or datetime.now().year
+    past = {}
+    for year, entry in history['years'].items():
+        if current_year - years <= int(year) < current_year:
+            for giver, recipient in entry['pairs'].items():
+                past.setdefault(giver, set()).add(recipient)
+    return past
+
+
+def merge_constraints(roster, past):
+    """Return person -> constraints with each person's past recipients (still in the roster) added"""
+    constraints = {}
+    for participant in roster:
+        excluded = list(participant.constraints)
+        excluded.extend(sorted(r for r in past.get(participant.name, ()) if r in roster and r not in excluded))
+        constraints[participant.name] = excluded
+    return constraints
@@ -0,0 +1,152 @@
+"""
+Write-ahead journal for real (non dry-run) gift exchange runs.
+
+The chosen assignment is written before the first SMS goes out, and every
+message gets a "sending" record before the Twilio call and a "sent"/"failed"
+record (with the Twilio SID) after it. Each record is flushed and fsynced
+locally as a JSON line, and the journal is copied to the S3 bucket after the
+assignment is chosen and after every result, since the local copy is lost with
+the container. If the process dies, `--resume <run-id>` replays the journal
+and only sends what is missing.
+"""
+
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from decouple import config
+from metrics import metrics
+
+JOURNAL_DIR = 'journal'
+JOURNAL_PREFIX = 'journals/'
+
+
+def new_run_id():
+    """Return a new run id based on the current date and time"""
+    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+
+class SendJournal:
+    """Append-only JSON Lines journal of one run, mirrored to S3"""
+
+    def __init__(self, run_id, s3_client=None, directory=None):
+        self.run_id = run_id
+        self.s3_client = s3_client
+        self.directory = directory or config('JOURNAL_DIR', default=JOURNAL_DIR)
+        self.path = os.path.join(self.directory, f"{run_id}.jsonl")
+        self.lock = threading.Lock()
+        # Held for the whole upload, so an older copy never overwrites a newer one in S3
+        self.upload_lock = threading.Lock()
+
+    @property
+    def s3_key(self):
+        return f"{JOURNAL_PREFIX}{self.run_id}.jsonl"
+
+    def append(self, event, **fields):
+        """Durably append one record to the local journal"""
+        record = {'event': event, 'time': datetime.now().isoformat(timespec='seconds'), **fields}
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, 'a') as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def upload(self):
+        """Copy the local journal to the S3 bucket (failures are reported, not raised)"""
+        if self.s3_client is None:
+            return
+        try:
+            with self.upload_lock:
+                with self.lock:
+                    with open(self.path, 'rb') as journal_file:
+                        data = journal_file.read()
+                self.s3_client.upload_fileobj(io.BytesIO(data), config('S3_BUCKET'), self.s3_key)
+            metrics.count('s3_bytes_uploaded', len(data))
+        except Exception as e:
+            print(f"⚠️  Could not copy send journal to S3: {e}")
+
+    def record_assignment(self, jobs):
+        """Record the assignment and its messages before anything is sent"""
+        self.append('assignment', run_id=self.run_id, jobs=jobs)
+        self.upload()
+
+    def record_sending(self, job):
+        """Record that a message is about to be sent"""
+        self.append('sending', person=job['person'])
+
+    def record_result(self, result):
+        """Record the outcome of a message and mirror the journal to S3"""
+        if result['status'] == 'sent':
+            self.append('sent', person=result['person'], sid=result['sid'])
+        else:
+            self.append('failed', person=result['person'], error=result['error'])
+        self.upload()
+
+    def record_upload(self, file_name):
+        """Record that the assignment file was written to S3"""
+        self.append('uploaded', file_name=file_name)
+
+    def download(self):
+        """Fetch the journal from S3 into the local journal directory, returning True on success"""
+        if self.s3_client is None:
+            return False
+        try:
+            response = self.s3_client.get_object(Bucket=config('S3_BUCKET'), Key=self.s3_key)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, 'wb') as journal_file:
+                journal_file.write(response['Body'].read())
+            return True
+        except Exception as e:
+            print(f"❌ Could not download send journal {self.s3_key}: {e}")
+            return False
+
+    def load(self):
+        """
+        Replay the journal and return its state, or None if there is no journal.
+
+        The state has the journaled jobs, the status of each person ('sent',
+        'failed', 'in-flight' or missing), their Twilio SIDs and the uploaded
+        assignment file name (None if the upload never happened).
+        """
+        if not os.path.exists(self.path) and not self.download():
+            return None
+
+        with open(self.path, 'rb') as journal_file:
+            data = journal_file.read()
+
+        records = []
+        good_length = 0
+        for raw in data.splitlines(keepends=True):
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                # A torn final line from a crash mid-write; everything before it is intact
+                break
+            good_length += len(raw)
+
+        # Drop a torn tail (and finish an unterminated line) so new records append cleanly
+        if good_length < len(data) or not data.endswith(b'\n'):
+            with open(self.path, 'r+b') as journal_file:
+                journal_file.truncate(good_length)
+                if good_length and not data[:good_length].endswith(b'\n'):
+                    journal_file.seek(good_length)
+                    journal_file.write(b'\n')
+
+        state = {'jobs': None, 'status': {}, 'sids': {}, 'file_name': None}
+        for record in records:
+            event = record['event']
+            if event == 'assignment':
+                state['jobs'] = record['jobs']
+            elif event == 'sending':
+                state['status'][record['person']] = 'in-flight'
+            elif event == 'sent':
+                state['status'][record['person']] = 'sent'
+                state['sids'][record['person']] = record['sid']
+            elif event == 'failed':
+                state['status'][record['person']] = 'failed'
+            elif event == 'uploaded':
+                state['file_name'] = record['file_name']
+        return state if state['jobs'] is not None else None
@@ -0,0 +1,148 @@
+"""
+Run metrics and profiling.
+
+A process-wide Metrics instance records the wall time of each phase of a run,
+counters (solver attempts, messages sent, bytes uploaded, ...) and the latency
+of every S3 and Twilio call. The summary (with latency percentiles) can be
+written as JSON, and a cProfile dump can be taken of the whole run, so a slow
+run can be traced to the solver, Twilio throttling or S3.
+"""
+
+import atexit
+import cProfile
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_samples, q):
+    """Return the q-th percentile (nearest rank) of an already sorted list"""
+    if not sorted_samples:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+class TimedClient:
+    """Proxy that records the latency of every method call on a client as '<prefix>.<method>'"""
+
+    def __init__(self, client, prefix, metrics):
+        self._client = client
+        self._prefix = prefix
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed_call(*args, **kwargs):
+            with self._metrics.timer(f"{self._prefix}.{name}"):
+                return attribute(*args, **kwargs)
+
+        return timed_call
+
+
+class Metrics:
+    """Thread-safe collector of phase times, counters, values and call latencies"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+        self.values = {}
+        self.latencies = {}
+        self.current_phase = None
+        self.phase_started = None
+
+    def begin_phase(self, name):
+        """End the running phase (if any) and start timing the next one"""
+        self.end_phase()
+        self.current_phase = name
+        self.phase_started = time.perf_counter()
+
+    def end_phase(self):
+        """Stop timing the running phase"""
+        if self.current_phase is None:
+            return
+        elapsed = time.perf_counter() - self.phase_started
+        self.phases[self.current_phase] = self.phases.get(self.current_phase, 0.0) + elapsed
+        self.current_phase = None
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Record how long the block took as one latency sample (failed calls included)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def instrument(self, client, prefix):
+        """Wrap a client so the latency of each of its calls is recorded"""
+        return TimedClient(client, prefix, self)
+
+    def summary(self):
+        """Return all metrics as a JSON-serializable dict (times in seconds)"""
+        self.end_phase()
+        with self.lock:
+            latencies = {}
+            for name, samples in self.latencies.items():
+                ordered = sorted(samples)
+                latencies[name] = {
+                    'calls': len(ordered),
+                    'total': sum(ordered),
+                    'mean': sum(ordered) / len(ordered),
+                    **{f"p{q}": percentile(ordered, q) for q in PERCENTILES},
+                    'max': ordered[-1],
+                }
+            return {
+                'total_seconds': time.perf_counter() - self.started,
+                'phases': dict(self.phases),
+                'counts': dict(self.counts),
+                'values': dict(self.values),
+                'latencies': latencies,
+            }
+
+    def write(self, path):
+        """Write the summary to a JSON file"""
+        with open(path, 'w') as metrics_file:
+            json.dump(self.summary(), metrics_file, indent=2)
+
+
+# Shared by every module in the process
+metrics = Metrics()
+
+
+def write_metrics_at_exit(path):
+    """Write the metrics to path when the process exits, including runs that stop early with an error"""
+    atexit.register(metrics.write, path)
+
+
+def profile_until_exit(path):
+    """Profile the rest of the run with cProfile and dump the stats to path at exit"""
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(path)
+
+    atexit.register(dump)
+    profiler.enable()
@@ -0,0 +1,144 @@
+"""
+Roster loading and compact participant records.
+
+A roster can be kept in any of three formats, picked by file extension:
+
+- .json: the json/data.json object, {"Name": {"phone_number": ..., "constraints": [...]}}
+- .jsonl / .ndjson: one {"name": ..., "phone_number": ..., "constraints": [...]} object per line
+- .csv: a name,phone_number,constraints header, with the constraints separated by ';'
+
+JSON Lines and CSV rosters are read a line at a time, so only the compact
+records are ever held in memory. Each participant is a __slots__ record with
+its constraints as a tuple, and every name is stored once and shared between
+the participant and the constraints that mention them, instead of the nested
+dicts, lists and repeated strings json.load builds.
+"""
+
+import csv
+import json
+import os
+import sys
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+CSV_EXTENSION = '.csv'
+CSV_CONSTRAINT_SEPARATOR = ';'
+
+
+class Participant:
+    """One person in the exchange"""
+
+    __slots__ = ('name', 'phone_number', 'constraints')
+
+    def __init__(self, name, phone_number, constraints=()):
+        self.name = name
+        self.phone_number = phone_number
+        self.constraints = tuple(constraints)
+
+    def __repr__(self):
+        return f"Participant({self.name!r}, {self.phone_number!r}, {self.constraints!r})"
+
+
+class Roster:
+    """Participants in file order, looked up by name"""
+
+    def __init__(self):
+        self.participants = {}
+
+    def add(self, name, phone_number, constraints=()):
+        """Add a participant, raising ValueError for a duplicate name"""
+        name = sys.intern(name)
+        if name in self.participants:
+            raise ValueError(f"{name} is in the roster more than once")
+        self.participants[name] = Participant(name, phone_number, map(sys.intern, constraints))
+
+    @property
+    def names(self):
+        return list(self.participants)
+
+    def constraints(self):
+        """Return person -> constraints for every participant"""
+        return {name: participant.constraints for name, participant in self.participants.items()}
+
+    def phone_number(self, name):
+        return self.participants[name].phone_number
+
+    def __len__(self):
+        return len(self.participants)
+
+    def __iter__(self):
+        return iter(self.participants.values())
+
+    def __contains__(self, name):
+        return name in self.participants
+
+    def __getitem__(self, name):
+        return self.participants[name]
+
+    def to_people_data(self):
+        """Return the roster in the json/data.json format"""
+        return {
+            participant.name: {'phone_number': participant.phone_number, 'constraints': list(participant.constraints)}
+            for participant in self
+        }
+
+    @classmethod
+    def from_people_data(cls, people_info):
+        """Build a roster from a people dict in the json/data.json format"""
+        roster = cls()
+        for name, info in people_info.items():
+            roster.add(name, info['phone_number'], info.get('constraints', ()))
+        return roster
+
+
+def read_json(json_file):
+    """Read a roster in the json/data.json format"""
+    return Roster.from_people_data(json.load(json_file))
+
+
+def read_json_lines(lines_file):
+    """Read a roster with one participant object per line"""
+    roster = Roster()
+    for line_number, line in enumerate(lines_file, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            roster.add(entry['name'], entry['phone_number'], entry.get('constraints', ()))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"line {line_number}: {e}") from None
+    return roster
+
+
+def read_csv(csv_file):
+    """Read a roster from CSV with name, phone_number and ';'-separated constraints columns"""
+    roster = Roster()
+    reader = csv.reader(csv_file)
+    header = [column.strip() for column in next(reader, [])]
+    missing = {'name', 'phone_number'} - set(header)
+    if missing:
+        raise ValueError(f"missing CSV column(s): {', '.join(sorted(missing))}")
+    name_column = header.index('name')
+    phone_column = header.index('phone_number')
+    constraints_column = header.index('constraints') if 'constraints' in header else None
+    for row in reader:
+        if not row:
+            continue
+        try:
+            constraints = row[constraints_column].split(CSV_CONSTRAINT_SEPARATOR) if constraints_column is not None else ()
+            roster.add(row[name_column].strip(), row[phone_column].strip(), [name.strip() for name in constraints if name.strip()])
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"line {reader.line_num}: {e}") from None
+    return roster
+
+
+def load_roster(path):
+    """Load a roster from a .json, .jsonl/.ndjson or .csv file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in JSON_LINES_EXTENSIONS:
+        with open(path) as lines_file:
+            return read_json_lines(lines_file)
+    if extension == CSV_EXTENSION:
+        with open(path, newline='') as csv_file:
+            return read_csv(csv_file)
+    with open(path) as json_file:
+        return read_json(json_file)
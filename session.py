@@ -0,0 +1,75 @@
+"""
+Shared service session for one run.
+
+The S3 and Twilio clients are built once per run and reused for the
+connection checks, the sends and the upload, so their HTTP connections (and
+TLS handshakes) are shared. The two connection checks run at the same time
+and both have to answer within CONNECTION_TIMEOUT seconds.
+"""
+
+import threading
+import time
+from decouple import config
+from helper import (
+    setup_s3_client, setup_twilio_client, test_s3_connection, test_twilio_connection,
+    DEFAULT_CONNECTION_TIMEOUT
+)
+
+
+class ServiceSession:
+    """Lazily built, shared S3 and Twilio clients with concurrent health checks"""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else config('CONNECTION_TIMEOUT', default=DEFAULT_CONNECTION_TIMEOUT, cast=float)
+        # One lock per client, so building one (and importing its SDK) doesn't hold up the other
+        self.s3_lock = threading.Lock()
+        self.twilio_lock = threading.Lock()
+        self._s3_client = None
+        self._twilio_client = None
+
+    @property
+    def s3_client(self):
+        with self.s3_lock:
+            if self._s3_client is None:
+                self._s3_client = setup_s3_client()
+            return self._s3_client
+
+    @property
+    def twilio_client(self):
+        with self.twilio_lock:
+            if self._twilio_client is None:
+                self._twilio_client = setup_twilio_client()
+            return self._twilio_client
+
+    def check_connections(self, s3=True, twilio=True):
+        """Check S3 and Twilio at the same time and return True if every check passed within the timeout"""
+        checks = []
+        if s3:
+            checks.append(('S3', lambda: test_s3_connection(self.s3_client)))
+        if twilio:
+            checks.append(('Twilio', lambda: test_twilio_connection(self.twilio_client)))
+
+        results = {}
+
+        def run(name, check):
+            try:
+                results[name] = check()
+            except Exception as e:
+                # e.g. missing settings while building the client
+                print(f"❌ {name} connection failed: {e}")
+                results[name] = False
+
+        # Daemon threads, so a check that never answers can't keep the process alive
+        threads = [threading.Thread(target=run, args=check, daemon=True) for check in checks]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + self.timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+        all_passed = True
+        for name, _ in checks:
+            if name not in results:
+                print(f"❌ {name} connection failed: no answer within {self.timeout:g} seconds")
+            all_passed = all_passed and results.get(name, False)
+        return all_passed
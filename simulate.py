@@ -0,0 +1,205 @@
+"""
+Monte Carlo simulation of the assignment generator.
+
+--simulate N generates N assignments for the roster with the same solver
+settings and checks as a real run, without connecting to S3 or Twilio. The
+runs are split over worker processes. Each worker validates its assignments
+in vectorized batches (see validation.py) and tallies how often every giver
+got every recipient. The combined result is a giver x recipient frequency
+matrix, a chi-square test of whether each giver's allowed recipients come up
+equally often, and the distribution of generation times.
+
+Equal odds for every allowed recipient is the ideal, but constraints can make
+it impossible. Assignments found by the rejection sampler are drawn uniformly
+from all valid gift cycles, which still favours the pairs that appear in more
+of those cycles. Assignments found by the backtracking fallback aren't uniform
+at all, so the count of each solver method is reported alongside. Some
+unevenness on tightly constrained rosters is expected either way.
+"""
+
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from metrics import percentile
+from solver import find_gift_cycle, new_seed, SEED_BITS
+from validation import check_permutations, forbidden_keys, np
+
+# Assignments validated and tallied together in one vectorized pass
+VALIDATION_BATCH = 256
+
+# Chunks of runs handed to each worker process, so slow runs even out between them
+CHUNKS_PER_WORKER = 4
+
+# Larger rosters skip the giver x recipient matrix (it grows with the square of the roster)
+MAX_MATRIX_PEOPLE = 2000
+
+# Givers listed in the summary with the least even recipient counts
+WORST_GIVERS = 5
+
+
+def _new_matrix(n):
+    if np is not None:
+        return np.zeros((n, n), dtype=np.int64)
+    return [[0] * n for _ in range(n)]
+
+
+def _tally(matrix, perms, valid):
+    """Add the valid encoded assignments to the giver x recipient counts"""
+    if np is not None:
+        rows = np.asarray(perms, dtype=np.int64)[np.asarray(valid, dtype=bool)]
+        n = matrix.shape[0]
+        flat = (np.arange(n) * n + rows).ravel()
+        matrix += np.bincount(flat, minlength=n * n).reshape(n, n)
+        return
+    for perm, is_valid in zip(perms, valid):
+        if is_valid:
+            for giver, recipient in enumerate(perm):
+                matrix[giver][recipient] += 1
+
+
+def simulate_chunk(index, seeds, with_matrix=True):
+    """Generate, time and validate one assignment per seed (runs in a worker process)"""
+    n = len(index)
+    ids = index.ids
+    keys = forbidden_keys(index) if np is not None else None
+    matrix = _new_matrix(n) if with_matrix else None
+    times = []
+    statuses = Counter()
+    methods = Counter()
+    invalid = 0
+    perms = []
+
+    def flush():
+        nonlocal invalid
+        if not perms:
+            return
+        valid = check_permutations(perms, index, keys)['valid']
+        invalid += len(perms) - int(sum(valid))
+        if matrix is not None:
+            _tally(matrix, perms, valid)
+        perms.clear()
+
+    for seed in seeds:
+        # Same search as generate_assignment in xmas-xchange.py
+        stats = {}
+        start = time.perf_counter()
+        cycle = find_gift_cycle(index, random.Random(seed), stats=stats)
+        times.append(time.perf_counter() - start)
+        statuses[stats['status']] += 1
+        if cycle is None:
+            continue
+        methods[stats['method']] += 1
+        perm = [0] * n
+        for i, person in enumerate(cycle):
+            perm[ids[person]] = ids[cycle[(i + 1) % n]]
+        perms.append(perm)
+        if len(perms) >= VALIDATION_BATCH:
+            flush()
+    flush()
+    return matrix, times, statuses, methods, invalid
+
+
+def run_simulation(index, runs, workers=None, seed=None):
+    """
+    Generate runs assignments over worker processes and return the combined results.
+
+    Run i uses seed + i, so a simulation with the same seed repeats exactly.
+    """
+    workers = workers or os.cpu_count() or 1
+    base_seed = seed if seed is not None else new_seed()
+    seeds = [(base_seed + i) % (1 << SEED_BITS) for i in range(runs)]
+    chunk_size = max(1, math.ceil(runs / (workers * CHUNKS_PER_WORKER)))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, runs, chunk_size)]
+    with_matrix = len(index) <= MAX_MATRIX_PEOPLE
+
+    start = time.perf_counter()
+    matrix = _new_matrix(len(index)) if with_matrix else None
+    times = []
+    statuses = Counter()
+    methods = Counter()
+    invalid = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_matrix, chunk_times, chunk_statuses, chunk_methods, chunk_invalid in executor.map(
+                simulate_chunk, [index] * len(chunks), chunks, [with_matrix] * len(chunks)):
+            if matrix is not None:
+                if np is not None:
+                    matrix += chunk_matrix
+                else:
+                    for row, chunk_row in zip(matrix, chunk_matrix):
+                        row[:] = [a + b for a, b in zip(row, chunk_row)]
+            times.extend(chunk_times)
+            statuses.update(chunk_statuses)
+            methods.update(chunk_methods)
+            invalid += chunk_invalid
+
+    return {
+        'runs': runs,
+        'seed': base_seed,
+        'workers': workers,
+        'elapsed': time.perf_counter() - start,
+        'matrix': matrix,
+        'times': sorted(times),
+        'statuses': dict(statuses),
+        'methods': dict(methods),
+        'invalid': invalid,
+    }
+
+
+def chi_square_p_value(chi2, df):
+    """Upper-tail p-value of a chi-square statistic (Wilson-Hilferty normal approximation)"""
+    if df <= 0:
+        return 1.0
+    h = 2 / (9 * df)
+    z = ((chi2 / df) ** (1 / 3) - (1 - h)) / math.sqrt(h)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def uniformity(matrix, index):
+    """
+    Chi-square test of equal odds over each giver's allowed recipients.
+
+    Returns {'givers': [...], 'chi2', 'df', 'p_value'}, with one entry per giver
+    that has at least two allowed recipients and the totals summed over them.
+    """
+    givers = []
+    for giver in range(len(index)):
+        allowed = [recipient for recipient in range(len(index)) if index.allows_id(giver, recipient)]
+        if len(allowed) < 2:
+            continue
+        counts = [int(matrix[giver][recipient]) for recipient in allowed]
+        total = sum(counts)
+        if total == 0:
+            continue
+        expected = total / len(allowed)
+        chi2 = sum((count - expected) ** 2 for count in counts) / expected
+        df = len(allowed) - 1
+        givers.append({
+            'giver': index.people[giver],
+            'allowed': len(allowed),
+            'min': min(counts),
+            'max': max(counts),
+            'expected': expected,
+            'chi2': chi2,
+            'df': df,
+            'p_value': chi_square_p_value(chi2, df),
+        })
+    chi2 = sum(entry['chi2'] for entry in givers)
+    df = sum(entry['df'] for entry in givers)
+    return {'givers': givers, 'chi2': chi2, 'df': df, 'p_value': chi_square_p_value(chi2, df)}
+
+
+def timing_summary(times):
+    """Return the mean and percentiles (in seconds) of already sorted generation times"""
+    if not times:
+        return {}
+    return {
+        'mean': sum(times) / len(times),
+        'min': times[0],
+        'p50': percentile(times, 50),
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+        'max': times[-1],
+    }
@@ -0,0 +1,445 @@
+"""
+Constraint-aware solver for the gift exchange cycle.
+
+The assignment is a single cycle through every participant where nobody gives
+to themselves or to anyone in their constraints list. Small or loosely
+constrained rosters are solved by rejection sampling, which picks uniformly
+among all valid cycles. Tightly constrained rosters fall back to a randomized
+backtracking search over the allowed-recipient graph with restarts, so the
+solver either finds a cycle, proves that none exists, or gives up after a
+bounded amount of work instead of looping forever. The backtracking search is
+not uniform: cycles it reaches early in its search order come up more often.
+stats['method'] records which of the two produced the cycle.
+
+Every search is driven by a seeded random generator, so the same roster and
+seed always give the same cycle. For hard rosters several independently
+seeded searches can run at once in worker processes; the first one to find a
+cycle wins and the others are told to stop.
+"""
+
+import math
+import multiprocessing
+import random
+import secrets
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Number of shuffles to try before switching to the backtracking search (also
+# capped so the shuffles cost no more than max_steps search steps)
+DEFAULT_MAX_ATTEMPTS = 1000
+
+# Shuffles are only tried when at least this many are expected to succeed
+MIN_EXPECTED_SUCCESSES = 1.0
+
+# Total number of search steps (moves + backtracks) across all restarts
+DEFAULT_MAX_STEPS = 2_000_000
+
+# Steps allowed in the first restart; doubled after each unsuccessful restart
+INITIAL_RESTART_STEPS = 1000
+
+# Random probes per search frame before building the full candidate list
+PROBES_PER_FRAME = 4
+
+# Search steps between checks for a cancellation request
+CANCEL_CHECK_STEPS = 1024
+
+# Size of the random seeds handed out for new searches
+SEED_BITS = 32
+
+# Result statuses recorded in the optional stats dict
+FOUND = 'found'
+INFEASIBLE = 'infeasible'
+EXHAUSTED = 'exhausted'
+INVALID = 'invalid'
+CANCELLED = 'cancelled'
+
+# Search that produced the cycle (or ran last), recorded as stats['method']
+REJECTION_SAMPLING = 'rejection_sampling'
+BACKTRACKING = 'backtracking'
+
+
+def _is_valid_cycle(order, forbidden):
+    """Return True if every consecutive pair in order (wrapping around) is allowed"""
+    previous = order[-1]
+    for current in order:
+        if current in forbidden[previous]:
+            return False
+        previous = current
+    return True
+
+
+def _acceptance_estimate(n, forbidden):
+    """Approximate probability that a random shuffle is a valid cycle"""
+    log_p = 0.0
+    for excluded in forbidden:
+        allowed = n - 1 - len(excluded)
+        if allowed <= 0:
+            return 0.0
+        log_p += math.log(allowed / (n - 1))
+    return math.exp(log_p)
+
+
+def new_seed():
+    """Return a fresh random seed for a search"""
+    return secrets.randbits(SEED_BITS)
+
+
+def _sample_cycle(n, forbidden, rng, max_attempts, stats, cancel=None):
+    """Rejection-sample a uniformly random valid cycle, or return None after max_attempts"""
+    # Each shuffle costs O(n), so don't spend them when they're unlikely to pay off
+    if _acceptance_estimate(n, forbidden) * max_attempts < MIN_EXPECTED_SUCCESSES:
+        return None
+    order = list(range(n))
+    for _ in range(max_attempts):
+        if cancel is not None and cancel.is_set():
+            return None
+        stats['attempts'] += 1
+        rng.shuffle(order)
+        if _is_valid_cycle(order, forbidden):
+            return order
+    return None
+
+
+def _search_cycle(n, forbidden, forbidden_by, start, rng, step_limit, stats, cancel=None):
+    """
+    Randomized depth-first search for a Hamiltonian cycle in the allowed graph.
+
+    Returns (cycle, complete) where cycle is a list of ids or None, and complete
+    is True when the whole search tree was explored without hitting step_limit.
+    """
+    # fr[u]: forbidden recipients of u still available (unvisited or start)
+    # fg[w]: givers still able to give (unvisited or current) that forbid w
+    fr = [len(forbidden[u]) for u in range(n)]
+    fg = [len(forbidden_by[w]) for w in range(n)]
+    max_forbidden = max(max(fr), max(fg))
+
+    unvisited = [u for u in range(n) if u != start]
+    position = [0] * n
+    for i, u in enumerate(unvisited):
+        position[u] = i
+
+    def remove(v):
+        i = position[v]
+        last = unvisited.pop()
+        if last != v:
+            unvisited[i] = last
+            position[last] = i
+
+    def restore(v):
+        position[v] = len(unvisited)
+        unvisited.append(v)
+
+    def move(current, v):
+        remove(v)
+        for u in forbidden_by[v]:
+            fr[u] -= 1
+        for w in forbidden[current]:
+            fg[w] -= 1
+
+    def undo(current, v):
+        for w in forbidden[current]:
+            fg[w] += 1
+        for u in forbidden_by[v]:
+            fr[u] += 1
+        restore(v)
+
+    def dead_end(v):
+        remaining = len(unvisited)
+        if remaining == 0:
+            return start in forbidden[v]
+        # v must still reach someone, and start must still have a giver
+        if fr[v] > remaining or fg[start] > remaining:
+            return True
+        # Counts only drop as the search advances, so skip the scan while no
+        # participant can possibly have run out of options yet
+        if remaining > max_forbidden:
+            return False
+        for u in unvisited:
+            if fr[u] >= remaining or fg[u] >= remaining:
+                return True
+        return False
+
+    path = [start]
+    # Each frame is [node, tried, candidates]; candidates is built lazily
+    frames = [[start, [], None]]
+    steps = 0
+
+    while frames:
+        if steps >= step_limit:
+            return None, False
+        if cancel is not None and steps % CANCEL_CHECK_STEPS == 0 and cancel.is_set():
+            return None, False
+        steps += 1
+
+        frame = frames[-1]
+        current, tried, candidates = frame
+        forbidden_current = forbidden[current]
+        chosen = None
+
+        if candidates is None and unvisited:
+            # Cheap random probes first; dense allowed graphs rarely need more
+            for _ in range(PROBES_PER_FRAME):
+                u = unvisited[rng.randrange(len(unvisited))]
+                if u not in forbidden_current and u not in tried:
+                    chosen = u
+                    break
+            if chosen is None:
+                candidates = [u for u in unvisited if u not in forbidden_current and u not in tried]
+                rng.shuffle(candidates)
+                # Try the recipients with the fewest possible givers left first
+                # (popped from the end), so nobody gets stranded late in the search
+                candidates.sort(key=fg.__getitem__)
+                frame[2] = candidates
+
+        if chosen is None and candidates:
+            chosen = candidates.pop()
+
+        if chosen is None:
+            # Nothing left to try from this node: backtrack
+            frames.pop()
+            path.pop()
+            if frames:
+                stats['backtracks'] += 1
+                undo(frames[-1][0], current)
+            continue
+
+        tried.append(chosen)
+        move(current, chosen)
+        path.append(chosen)
+        if dead_end(chosen):
+            path.pop()
+            undo(current, chosen)
+            continue
+        if not unvisited:
+            return path, True
+        frames.append([chosen, [], None])
+
+    return None, True
+
+
+def find_gift_cycle(index, rng=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                    max_steps=DEFAULT_MAX_STEPS, stats=None, cancel=None):
+    """
+    Find a single gift cycle through everyone in a ConstraintIndex.
+
+    Returns the people in cycle order (each gives to the next, the last gives to
+    the first), or None when no cycle exists or the search budget ran out. Pass a
+    dict as stats to receive the status, method, attempt and backtrack counts. cancel is
+    an optional Event; once it is set the search stops with status CANCELLED.
+    """
+    rng = rng or random
+    stats = stats if stats is not None else {}
+    stats.update(status=None, method=None, attempts=0, backtracks=0, restarts=0)
+
+    people = index.people
+    n = len(people)
+    if n < 2:
+        stats['status'] = INFEASIBLE
+        return None
+
+    forbidden = index.forbidden
+    forbidden_by = index.forbidden_by
+
+    # Someone who can't give to anyone (or receive from anyone) rules out any cycle
+    for i in range(n):
+        if len(forbidden[i]) >= n - 1 or len(forbidden_by[i]) >= n - 1:
+            stats['status'] = INFEASIBLE
+            return None
+
+    # A single cycle needs everyone to be able to reach everyone else
+    if len(index.reachable_from(0)) < n or len(index.reachable_from(0, reverse=True)) < n:
+        stats['status'] = INFEASIBLE
+        return None
+
+    # Shuffling costs about n steps per attempt, so budget it like the search
+    order = _sample_cycle(n, forbidden, rng, min(max_attempts, max_steps // n), stats, cancel)
+    stats['method'] = REJECTION_SAMPLING
+
+    if order is None:
+        stats['method'] = BACKTRACKING
+        # Start from the most constrained person; any cycle passes through them
+        start = max(range(n), key=lambda i: len(forbidden[i]) + len(forbidden_by[i]))
+        budget = max_steps
+        # A single pass down to a full cycle takes n steps, so leave room for it
+        step_limit = INITIAL_RESTART_STEPS + 2 * n
+        while budget > 0:
+            if cancel is not None and cancel.is_set():
+                stats['status'] = CANCELLED
+                return None
+            limit = min(step_limit, budget)
+            order, complete = _search_cycle(n, forbidden, forbidden_by, start, rng, limit, stats, cancel)
+            if order is not None:
+                # Rotate randomly so the start person isn't always listed first
+                shift = rng.randrange(n)
+                order = order[shift:] + order[:shift]
+                break
+            if complete:
+                stats['status'] = INFEASIBLE
+                return None
+            budget -= limit
+            step_limit *= 2
+            stats['restarts'] += 1
+
+    if order is None:
+        stats['status'] = CANCELLED if cancel is not None and cancel.is_set() else EXHAUSTED
+        return None
+
+    stats['status'] = FOUND
+    return [people[i] for i in order]
+
+
+# Set in each portfolio worker process
+_cancel_event = None
+
+
+def _init_portfolio_worker(cancel):
+    global _cancel_event
+    _cancel_event = cancel
+
+
+def _portfolio_search(index, seed, max_attempts, max_steps):
+    """Run one seeded search in a portfolio worker and return (seed, cycle, stats)"""
+    stats = {}
+    cycle = find_gift_cycle(index, random.Random(seed), max_attempts, max_steps, stats, _cancel_event)
+    if stats['status'] in (FOUND, INFEASIBLE):
+        # Either answer settles it for every other search too
+        _cancel_event.set()
+    return seed, cycle, stats
+
+
+def find_gift_cycle_parallel(index, workers, seeds=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                             max_steps=DEFAULT_MAX_STEPS, stats=None):
+    """
+    Run independently seeded searches in worker processes and return the first cycle found.
+
+    The other searches are cancelled as soon as one finds a cycle or proves
+    that none exists. stats receives the winning search's stats plus its seed,
+    so find_gift_cycle(index, random.Random(seed)) reproduces the same cycle.
+    """
+    stats = stats if stats is not None else {}
+    if seeds is None:
+        seeds = [new_seed() for _ in range(workers)]
+    cancel = multiprocessing.Event()
+    result = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_portfolio_worker, initargs=(cancel,)) as executor:
+        futures = [executor.submit(_portfolio_search, index, seed, max_attempts, max_steps) for seed in seeds]
+        for future in as_completed(futures):
+            seed, cycle, search_stats = future.result()
+            if result is None or search_stats['status'] in (FOUND, INFEASIBLE):
+                result = seed, cycle, search_stats
+            if search_stats['status'] in (FOUND, INFEASIBLE):
+                cancel.set()
+                break
+
+    seed, cycle, search_stats = result
+    stats.clear()
+    stats.update(search_stats, seed=seed, searches=len(seeds))
+    return cycle
+
+
+def repair_cycle(previous, index, rng=None, stats=None):
+    """
+    Splice an earlier gift cycle to match the people in a ConstraintIndex.
+
+    People who dropped out are cut out of the cycle (their giver takes over
+    their recipient). Anyone left giving to a forbidden recipient first gets a
+    newcomer placed in between, and only if no newcomer fits is that recipient
+    moved. The remaining newcomers and moved people are inserted between two
+    neighbours they are allowed to give to and receive from, preferring givers
+    whose recipient already changed. Everyone else keeps their recipient. Returns the new person -> recipient dict, or None if
+    the earlier assignment isn't a single cycle (status INVALID) or the cycle
+    couldn't be repaired this way (status EXHAUSTED). Pass a dict as stats to
+    receive the status and the joined, removed and moved people.
+    """
+    rng = rng or random
+    stats = stats if stats is not None else {}
+    succ = dict(previous)
+    pred = {recipient: giver for giver, recipient in succ.items()}
+
+    removed = [person for person in succ if person not in index.ids]
+    joined = [person for person in index.people if person not in succ]
+    stats.update(status=None, joined=joined, removed=removed, moved=[])
+
+    # Splicing keeps a single cycle intact, so the earlier assignment has to be one
+    if not succ or set(pred) != set(succ):
+        stats['status'] = INVALID
+        return None
+    first = next(iter(succ))
+    person, length = succ[first], 1
+    while person != first and length <= len(succ):
+        person, length = succ[person], length + 1
+    if length != len(succ):
+        stats['status'] = INVALID
+        return None
+
+    def detach(person):
+        giver, recipient = pred.pop(person), succ.pop(person)
+        succ[giver] = recipient
+        pred[recipient] = giver
+        return giver
+
+    def insert(giver, person):
+        recipient = succ[giver]
+        succ[giver] = person
+        succ[person] = recipient
+        pred[person] = giver
+        pred[recipient] = person
+
+    def fits(giver, person):
+        return index.allows(giver, person) and index.allows(person, succ[giver])
+
+    # Cut out everyone who dropped out
+    for person in removed:
+        if len(succ) <= 2:
+            stats['status'] = EXHAUSTED
+            return None
+        detach(person)
+
+    # Fix recipients that are no longer allowed (a shortcut around someone who
+    # left, or a constraint added since the last run). Filling the gap with
+    # someone who needs a place anyway changes nobody else; otherwise the
+    # recipient is moved somewhere else.
+    pending = list(joined)
+    bad = [giver for giver, recipient in succ.items() if not index.allows(giver, recipient)]
+    while bad:
+        giver = bad.pop()
+        if giver not in succ or index.allows(giver, succ[giver]):
+            continue
+        filler = next((person for person in pending if fits(giver, person)), None)
+        if filler is not None:
+            pending.remove(filler)
+            insert(giver, filler)
+            continue
+        if len(succ) <= 2:
+            stats['status'] = EXHAUSTED
+            return None
+        recipient = succ[giver]
+        detach(recipient)
+        pending.append(recipient)
+        stats['moved'].append(recipient)
+        bad.append(giver)
+
+    # Insert each pending person between a giver and recipient that both work
+    # for them. A giver whose recipient already changed costs no extra change,
+    # so try those first and only then a random spot in the rest of the cycle.
+    touched = [giver for giver, recipient in succ.items() if previous.get(giver) != recipient]
+    members = list(succ)
+    for person in pending:
+        candidates = [giver for giver in touched if fits(giver, person)]
+        if candidates:
+            giver = rng.choice(candidates)
+        else:
+            offset = rng.randrange(len(members))
+            for i in range(len(members)):
+                giver = members[(offset + i) % len(members)]
+                if giver in succ and fits(giver, person):
+                    break
+            else:
+                stats['status'] = EXHAUSTED
+                return None
+            touched.append(giver)
+        insert(giver, person)
+        touched.append(person)
+        members.append(person)
+
+    stats['status'] = FOUND
+    return succ
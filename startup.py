@@ -0,0 +1,69 @@
+"""
+Startup time report.
+
+Import this module before anything else. When the command line contains
+--startup-report it times every module imported for the first time from then
+on, including the SDKs that are only imported once a client is built, and
+prints a breakdown to stderr when the process exits.
+"""
+
+import atexit
+import builtins
+import sys
+import threading
+import time
+
+STARTUP_REPORT_FLAG = '--startup-report'
+
+# Imports faster than this are left out of the report
+MIN_REPORT_SECONDS = 0.001
+
+# Nesting levels shown in the report (deeper imports are included in their parent's time)
+MAX_REPORT_DEPTH = 2
+
+started = time.perf_counter()
+imports = []  # (order, depth, module name, seconds)
+_original_import = builtins.__import__
+_lock = threading.Lock()
+# Import nesting depth, per thread since the connection checks import the SDKs in parallel
+_local = threading.local()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """builtins.__import__ replacement that records how long first-time imports take"""
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    with _lock:
+        order = len(imports)
+        imports.append(None)
+    depth = getattr(_local, 'depth', 0) + 1
+    _local.depth = depth
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        imports[order] = (order, depth, name, time.perf_counter() - start)
+        _local.depth = depth - 1
+
+
+def print_report():
+    """Print the import time breakdown and total time since startup to stderr"""
+    total = time.perf_counter() - started
+    print("Startup report (first-time imports, including nested imports):", file=sys.stderr)
+    # Imports still running in another thread at exit have no entry yet
+    finished = [entry for entry in imports if entry is not None]
+    for _, depth, name, seconds in finished:
+        if depth <= MAX_REPORT_DEPTH and seconds >= MIN_REPORT_SECONDS:
+            print(f"  {'  ' * (depth - 1)}{name:<{32 - 2 * depth}} {seconds * 1000:8.1f} ms", file=sys.stderr)
+    imported = sum(seconds for _, depth, _, seconds in finished if depth == 1)
+    print(f"  Total import time: {imported * 1000:.1f} ms of {total * 1000:.1f} ms run time", file=sys.stderr)
+
+
+def install():
+    """Start timing imports and print the report when the process exits"""
+    builtins.__import__ = _timed_import
+    atexit.register(print_report)
+
+
+if STARTUP_REPORT_FLAG in sys.argv:
+    install()
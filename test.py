@@ -11,55 +11,40 @@ import tempfile
 import os
 import re
 from datetime import datetime
-from helper import setup_s3_client, get_assignment_file_content, parse_assignments, Colors
+from helper import setup_twilio_client, stream_assignments, query_assignments, Colors
+from session import ServiceSession
+from constraints import ConstraintIndex
+from roster import load_roster
+from dispatch import SmsDispatcher
+from validation import assignment_issues
+from backends import sms_backend
 
 def load_people_data():
-    """Load people information and constraints from JSON file"""
-    with open('json/data.json') as json_file:
-        data = json.load(json_file)
-    
-    people = list(data.keys())
-    constraints = {person: info['constraints'] for person, info in data.items()}
-    return people, constraints, data
+    """Load people information and constraints from the roster file"""
+    roster = load_roster('json/data.json')
+    return roster.names, roster.constraints(), roster
 
-def validate_constraints(assignments, constraints):
-    """Validate that no assignments violate constraints"""
-    violations = []
-    
-    for person, recipient in assignments.items():
-        if recipient in constraints.get(person, []):
-            violations.append(f"{person} cannot give to {recipient} (constraint violation)")
-    
+def validate_constraints(issues):
+    """Validate that no assignments violate the constraints, given their assignment_issues"""
+    violations = [f"{person} cannot give to {recipient} (constraint violation)" for person, recipient in issues['forbidden']]
+    violations += [f"{person} cannot give to themselves (constraint violation)" for person in issues['self_gifting']]
     return violations
 
-def validate_assignment_completeness(assignments, people):
-    """Ensure everyone gives and receives exactly once"""
-    givers = set(assignments.keys())
-    recipients = set(assignments.values())
-    people_set = set(people)
-    
-    issues = []
-    
-    # Check if everyone is a giver
-    missing_givers = people_set - givers
-    if missing_givers:
-        issues.append(f"Missing givers: {', '.join(missing_givers)}")
+def validate_assignment_completeness(issues):
+    """Ensure everyone gives and receives exactly once, in a single gift cycle, given the assignment_issues"""
+    problems = []
+    if issues['unknown']:
+        problems.append(f"Unknown people: {', '.join(issues['unknown'])}")
+    if issues['missing_givers']:
+        problems.append(f"Missing givers: {', '.join(issues['missing_givers'])}")
+    if issues['missing_recipients']:
+        problems.append(f"Missing recipients: {', '.join(issues['missing_recipients'])}")
+    if issues['duplicate_recipients']:
+        problems.append(f"Duplicate recipients: {', '.join(issues['duplicate_recipients'])}")
+    if issues['cycles'] is not None and issues['cycles'] != 1:
+        problems.append(f"Assignment splits into {issues['cycles']} separate gift cycles instead of one")
     
-    # Check if everyone is a recipient
-    missing_recipients = people_set - recipients
-    if missing_recipients:
-        issues.append(f"Missing recipients: {', '.join(missing_recipients)}")
-    
-    # Check for duplicate recipients
-    recipient_counts = {}
-    for recipient in assignments.values():
-        recipient_counts[recipient] = recipient_counts.get(recipient, 0) + 1
-    
-    duplicates = [name for name, count in recipient_counts.items() if count > 1]
-    if duplicates:
-        issues.append(f"Duplicate recipients: {', '.join(duplicates)}")
-    
-    return issues
+    return problems
 
 def run_dry_run():
     """Run the main script in dry-run mode and capture the output"""
@@ -92,7 +77,7 @@ def run_dry_run():
             output = captured_output.getvalue()
             
             # Extract filename from output
-            filename_match = re.search(r'(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}_gift_assignments_dryrun\.txt)', output)
+            filename_match = re.search(r'(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}_gift_assignments_dryrun\.txt\.gz)', output)
             if filename_match:
                 filename = filename_match.group(1)
                 return filename
@@ -108,64 +93,91 @@ def run_dry_run():
         print(f"{Colors.RED}❌ Dry-run failed: {e}{Colors.END}")
         return None
 
-def test_helper_queries(filename, test_people):
-    """Test the helper script with specific people"""
+def test_helper_queries(filename, test_people, s3_client=None):
+    """Test the helper's batch query with specific people (one connection check and one download)"""
     results = {}
+    try:
+        answers = query_assignments(filename, test_people, s3_client)
+    except Exception as e:
+        print(f"  {Colors.RED}❌ Helper query failed: {e}{Colors.END}")
+        return results
+    
+    if answers is None:
+        print(f"  {Colors.RED}❌ Helper query failed for {filename}{Colors.END}")
+        return results
+    
     for person in test_people:
-        try:
-            # Import and use helper functions directly
-            import sys
-            import io
-            from contextlib import redirect_stdout
-            
-            # Capture stdout to get the result
-            captured_output = io.StringIO()
-            
-            # Set up command line arguments for helper script
-            original_argv = sys.argv
-            sys.argv = ['helper.py', filename, person]
-            
-            try:
-                import importlib
-                import helper
-                importlib.reload(helper)  # Reload to ensure fresh run
-                
-                with redirect_stdout(captured_output):
-                    result_code = helper.main()
-                
-                if result_code == 0:
-                    output = captured_output.getvalue()
-                    lines = output.strip().split('\n')
-                    
-                    # Find the assignment line
-                    assignment_line = None
-                    for line in lines:
-                        if ' -> ' in line and person in line:
-                            assignment_line = line
-                            break
-                    
-                    if assignment_line:
-                        # Extract recipient from "Person -> Recipient"
-                        parts = assignment_line.split(' -> ')
-                        if len(parts) == 2:
-                            recipient = parts[1].strip()
-                            results[person] = recipient
-                            print(f"  {Colors.GREEN}✅ {person} -> {recipient}{Colors.END}")
-                        else:
-                            print(f"  {Colors.RED}❌ Could not parse assignment for {person}{Colors.END}")
-                    else:
-                        print(f"  {Colors.RED}❌ No assignment found for {person}{Colors.END}")
-                else:
-                    print(f"  {Colors.RED}❌ Helper query failed for {person} (exit code: {result_code}){Colors.END}")
-                    
-            finally:
-                sys.argv = original_argv
-                
-        except Exception as e:
-            print(f"  {Colors.RED}❌ Helper query failed for {person}: {e}{Colors.END}")
+        recipient = answers.get(person)
+        if recipient is not None:
+            results[person] = recipient
+            print(f"  {Colors.GREEN}✅ {person} -> {recipient}{Colors.END}")
+        else:
+            print(f"  {Colors.RED}❌ No assignment found for {person}{Colors.END}")
     
     return results
 
+def start_fake_twilio_server():
+    """Start a local HTTP server that mimics the Twilio Messages API and throttles each number once"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs
+    
+    throttled = set()
+    lock = threading.Lock()
+    
+    class FakeTwilioHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode())
+            to = form.get('To', [''])[0]
+            with lock:
+                first_attempt = to not in throttled
+                throttled.add(to)
+            if first_attempt:
+                status, payload = 429, {'code': 20429, 'message': 'Too Many Requests', 'status': 429}
+            else:
+                status, payload = 201, {'sid': f"SMfake{len(throttled)}", 'to': to, 'status': 'queued'}
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTwilioHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_sms_dispatch(people):
+    """Send one message per person through the dispatcher, against a local fake Twilio endpoint unless a local SMS backend is configured"""
+    server = start_fake_twilio_server() if sms_backend() == 'twilio' else None
+    try:
+        twilio_client = setup_twilio_client()
+        if server:
+            twilio_client.api.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        
+        jobs = [{'person': person, 'to': f"+1555000{i:04d}", 'body': 'test'} for i, person in enumerate(people)]
+        dispatcher = SmsDispatcher(twilio_client, from_number='+15550000000', rate_limit=50, backoff=0.01)
+        results = dispatcher.send_all(jobs)
+        
+        # The fake server throttles every number once, so each message needs a retry
+        expected_attempts = 2 if server else 1
+        failed = [r for r in results if r['status'] != 'sent' or r['attempts'] != expected_attempts]
+        if failed:
+            for r in failed:
+                print(f"  {Colors.RED}❌ {r['person']}: {r['status']} after {r['attempts']} attempts ({r['error']}){Colors.END}")
+            return False
+        return True
+    except Exception as e:
+        print(f"{Colors.RED}❌ SMS dispatch test failed: {e}{Colors.END}")
+        return False
+    finally:
+        if server:
+            server.shutdown()
+
 def download_and_validate_full_assignment(s3_client, filename):
     """Download the full assignment file and validate it completely"""
     print(f"{Colors.BLUE}Downloading and validating full assignment...{Colors.END}")
@@ -174,12 +186,11 @@ def download_and_validate_full_assignment(s3_client, filename):
         from decouple import config
         bucket_name = config('S3_BUCKET')
         
-        content = get_assignment_file_content(s3_client, bucket_name, filename)
-        if content is None:
+        assignments = stream_assignments(s3_client, bucket_name, filename)
+        if assignments is None:
             print(f"{Colors.RED}❌ Failed to download assignment file{Colors.END}")
             return None
         
-        assignments = parse_assignments(content)
         if not assignments:
             print(f"{Colors.RED}❌ No assignments found in file{Colors.END}")
             return None
@@ -197,6 +208,7 @@ def run_comprehensive_test():
     
     # Load test data
     people, constraints, people_data = load_people_data()
+    index = ConstraintIndex(people, constraints)
     print(f"Loaded {len(people)} people with constraints")
     
     # Display constraints for clarity
@@ -211,21 +223,25 @@ def run_comprehensive_test():
     # Test connections before proceeding
     print(f"{Colors.BLUE}Testing service connections...{Colors.END}")
     
-    # Test S3 connection
-    s3_client = setup_s3_client()
-    from helper import test_s3_connection, test_twilio_connection
-    if not test_s3_connection(s3_client):
-        print(f"{Colors.RED}❌ Test failed: S3 connection failed{Colors.END}")
-        return False
-    
-    # Test Twilio connection
-    if not test_twilio_connection():
-        print(f"{Colors.RED}❌ Test failed: Twilio connection failed{Colors.END}")
+    # Test the S3 and Twilio connections at the same time, with one shared client each
+    session = ServiceSession()
+    if not session.check_connections():
+        print(f"{Colors.RED}❌ Test failed: service connection failed{Colors.END}")
         return False
+    s3_client = session.s3_client
     
     print(f"{Colors.GREEN}✅ All service connections successful{Colors.END}")
     print()
     
+    # Exercise the concurrent SMS dispatcher without sending real messages
+    sms_target = 'a local fake Twilio endpoint' if sms_backend() == 'twilio' else f"the {sms_backend()} SMS backend"
+    print(f"{Colors.BLUE}Testing SMS dispatch against {sms_target}...{Colors.END}")
+    if not test_sms_dispatch(people):
+        print(f"{Colors.RED}❌ Test failed: SMS dispatch{Colors.END}")
+        return False
+    print(f"{Colors.GREEN}✅ All {len(people)} test messages were sent{Colors.END}")
+    print()
+    
     # Step 1: Run dry-run
     print(f"{Colors.BLUE}Running dry-run...{Colors.END}")
     filename = run_dry_run()
@@ -237,7 +253,7 @@ def run_comprehensive_test():
     
     # Step 2: Test helper queries for all people
     print(f"{Colors.BLUE}Testing helper queries for all {len(people)} people{Colors.END}")
-    helper_results = test_helper_queries(filename, people)
+    helper_results = test_helper_queries(filename, people, s3_client)
     
     if len(helper_results) != len(people):
         print(f"{Colors.RED}❌ Helper queries failed - got {len(helper_results)} results for {len(people)} people{Colors.END}")
@@ -252,7 +268,8 @@ def run_comprehensive_test():
     
     # Step 4: Validate constraints
     print(f"{Colors.BLUE}Validating constraints...{Colors.END}")
-    constraint_violations = validate_constraints(full_assignments, constraints)
+    issues = assignment_issues(full_assignments, index)
+    constraint_violations = validate_constraints(issues)
     
     if constraint_violations:
         print(f"{Colors.RED}❌ Constraint violations found:{Colors.END}")
@@ -263,7 +280,7 @@ def run_comprehensive_test():
         print(f"{Colors.GREEN}✅ All constraints satisfied{Colors.END}")
     
     print(f"{Colors.BLUE}Validating assignment completeness...{Colors.END}")
-    completeness_issues = validate_assignment_completeness(full_assignments, people)
+    completeness_issues = validate_assignment_completeness(issues)
     
     if completeness_issues:
         print(f"{Colors.RED}❌ Assignment completeness issues:{Colors.END}")
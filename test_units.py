@@ -0,0 +1,807 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the solver, archive index, roster parsing and the other
+building blocks of the gift exchange.
+
+They run offline against the in-memory storage and SMS backends, so no .env
+or credentials are needed:
+
+    python test_units.py
+"""
+
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+# Keep every test on the local backends, whatever the .env says
+os.environ.update(STORAGE_BACKEND='memory', SMS_BACKEND='memory', S3_BUCKET='unit-tests')
+
+import backends
+import batch
+from archive import build_index, lookup, fetch_recipient, upload_index, is_not_found
+from backends import MemoryStorage, LocalSmsClient, BackendError
+from cache import AssignmentCache, is_not_modified
+from constraints import ConstraintIndex
+from dispatch import SmsDispatcher
+from feasibility import check_feasibility, constraint_warnings
+import helper
+from helper import write_assignment_data, stream_assignments, load_main_module, upload_assignment_data_to_s3, decompressed
+from history import empty_history, add_assignment, past_recipients, merge_constraints, sync_history
+from journal import SendJournal
+from metrics import Metrics, percentile
+from session import ServiceSession
+from roster import Roster, read_json_lines, read_csv
+from simulate import run_simulation, uniformity
+from solver import (find_gift_cycle, find_gift_cycle_parallel, repair_cycle,
+                    FOUND, INFEASIBLE, INVALID, REJECTION_SAMPLING, BACKTRACKING)
+from validation import assignment_issues, check_permutations, encode_assignment
+
+BUCKET = 'unit-tests'
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_index(people, constraints=None):
+    """Build a ConstraintIndex from a list of names and an optional person -> constraints dict"""
+    return ConstraintIndex(people, constraints or {})
+
+
+def names(count):
+    return [f"Person{i}" for i in range(count)]
+
+
+def tight_index(count=40, allowed_steps=(1, 2, 5)):
+    """Everyone may only give to the people a few places after them, which forces the backtracking search"""
+    people = names(count)
+    constraints = {
+        person: [people[j] for j in range(count) if j != i and (j - i) % count not in allowed_steps]
+        for i, person in enumerate(people)
+    }
+    return make_index(people, constraints)
+
+
+def as_assignment(cycle):
+    return {cycle[i]: cycle[(i + 1) % len(cycle)] for i in range(len(cycle))}
+
+
+class ConstraintIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = make_index(['Adam', 'Beth', 'Carl'], {'Adam': ['Beth', 'Adam', 'Zed'], 'Carl': ['Adam']})
+
+    def test_constraints_are_compiled(self):
+        self.assertEqual(self.index.forbidden, [frozenset({1}), frozenset(), frozenset({0})])
+        self.assertEqual(self.index.forbidden_by, [frozenset({2}), frozenset({0}), frozenset()])
+        self.assertEqual(self.index.unknown, {'Adam': ['Zed']})
+
+    def test_allows(self):
+        self.assertTrue(self.index.allows('Adam', 'Carl'))
+        self.assertFalse(self.index.allows('Adam', 'Beth'))
+        self.assertFalse(self.index.allows('Beth', 'Beth'))
+        self.assertFalse(self.index.allows('Beth', 'Zed'))
+
+    def test_check_ignores_unknown_names(self):
+        self.assertTrue(self.index.check({'Adam': 'Carl', 'Carl': 'Beth', 'Beth': 'Adam', 'Zed': 'Adam'}))
+        self.assertFalse(self.index.check({'Adam': 'Beth', 'Beth': 'Carl', 'Carl': 'Adam'}))
+
+    def test_reachable_from(self):
+        self.assertEqual(self.index.reachable_from(0), {0, 1, 2})
+        self.assertEqual(self.index.reachable_from(1, reverse=True), {0, 1, 2})
+        self.assertEqual(self.index.reachable_from(0, within=[0, 1]), {0})
+
+
+class SolverTests(unittest.TestCase):
+
+    def test_cycle_passes_the_constraints(self):
+        index = make_index(['Adam', 'Beth', 'Carl', 'Dana'], {'Adam': ['Beth'], 'Beth': ['Adam']})
+        for seed in range(20):
+            stats = {}
+            cycle = find_gift_cycle(index, random.Random(seed), stats=stats)
+            self.assertEqual(stats['status'], FOUND)
+            self.assertEqual(sorted(cycle), sorted(index.people))
+            self.assertTrue(index.check(as_assignment(cycle)))
+
+    def test_infeasible_roster(self):
+        # Adam and Beth can only give to Carl between them
+        index = make_index(['Adam', 'Beth', 'Carl', 'Dana'], {'Adam': ['Beth', 'Dana'], 'Beth': ['Adam', 'Dana']})
+        stats = {}
+        self.assertIsNone(find_gift_cycle(index, random.Random(1), stats=stats))
+        self.assertEqual(stats['status'], INFEASIBLE)
+
+    def test_too_few_people(self):
+        stats = {}
+        self.assertIsNone(find_gift_cycle(make_index(['Adam']), stats=stats))
+        self.assertEqual(stats['status'], INFEASIBLE)
+
+    def test_same_seed_same_cycle(self):
+        for index in (make_index(names(12)), tight_index()):
+            first = find_gift_cycle(index, random.Random(1234))
+            self.assertEqual(find_gift_cycle(index, random.Random(1234)), first)
+
+    def test_method_is_recorded(self):
+        stats = {}
+        find_gift_cycle(make_index(names(6)), random.Random(1), stats=stats)
+        self.assertEqual(stats['method'], REJECTION_SAMPLING)
+
+        index = tight_index()
+        stats = {}
+        cycle = find_gift_cycle(index, random.Random(1), stats=stats)
+        self.assertEqual(stats['method'], BACKTRACKING)
+        self.assertTrue(index.check(as_assignment(cycle)))
+
+    def test_hopeless_shuffles_are_skipped(self):
+        # A random shuffle is almost never valid here, so go straight to backtracking
+        rng = random.Random(3)
+        people = names(500)
+        index = make_index(people, {person: rng.sample(people, 50) for person in people[:90]})
+        stats = {}
+        cycle = find_gift_cycle(index, random.Random(1), stats=stats)
+        self.assertEqual((stats['method'], stats['attempts']), (BACKTRACKING, 0))
+        self.assertTrue(index.check(as_assignment(cycle)))
+
+    def test_shuffles_are_budgeted_by_steps(self):
+        people = names(100)
+        index = make_index(people, {person: people[i + 1:i + 6] for i, person in enumerate(people)})
+        stats = {}
+        find_gift_cycle(index, random.Random(1), max_attempts=1000, max_steps=300, stats=stats)
+        self.assertLessEqual(stats['attempts'], 3)
+
+    def test_parallel_seed_reproduces_the_cycle(self):
+        index = tight_index()
+        stats = {}
+        cycle = find_gift_cycle_parallel(index, 2, seeds=[11, 22], stats=stats)
+        self.assertEqual(stats['status'], FOUND)
+        self.assertIn(stats['seed'], (11, 22))
+        self.assertEqual(find_gift_cycle(index, random.Random(stats['seed'])), cycle)
+
+
+class RepairCycleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = as_assignment(['Adam', 'Beth', 'Carl', 'Dana', 'Evan'])
+
+    def test_drop_splices_the_giver_to_the_recipient(self):
+        index = make_index(['Adam', 'Beth', 'Dana', 'Evan'])
+        stats = {}
+        repaired = repair_cycle(self.previous, index, random.Random(1), stats)
+        self.assertEqual(stats['status'], FOUND)
+        self.assertEqual(stats['removed'], ['Carl'])
+        self.assertEqual(repaired['Beth'], 'Dana')
+        for giver in ('Adam', 'Dana', 'Evan'):
+            self.assertEqual(repaired[giver], self.previous[giver])
+        self.assertTrue(index.check(repaired))
+
+    def test_join_inserts_the_newcomer(self):
+        index = make_index(['Adam', 'Beth', 'Carl', 'Dana', 'Evan', 'Fred'])
+        stats = {}
+        repaired = repair_cycle(self.previous, index, random.Random(1), stats)
+        self.assertEqual(stats['status'], FOUND)
+        self.assertEqual(stats['joined'], ['Fred'])
+        # Only the giver who now gives to Fred changes
+        changed = [giver for giver in self.previous if repaired[giver] != self.previous[giver]]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(repaired[changed[0]], 'Fred')
+        self.assertEqual(repaired['Fred'], self.previous[changed[0]])
+        self.assertTrue(index.check(repaired))
+
+    def test_forbidden_shortcut_is_moved(self):
+        # Dropping Carl would make Beth give to Dana, which she can't
+        index = make_index(['Adam', 'Beth', 'Dana', 'Evan'], {'Beth': ['Dana']})
+        stats = {}
+        repaired = repair_cycle(self.previous, index, random.Random(1), stats)
+        self.assertEqual(stats['status'], FOUND)
+        self.assertEqual(stats['moved'], ['Dana'])
+        self.assertTrue(index.check(repaired))
+
+    def test_newcomer_fills_the_forbidden_shortcut(self):
+        # Carl leaves and Beth can't give to Dana, but Fred fits in between
+        index = make_index(['Adam', 'Beth', 'Dana', 'Evan', 'Fred'], {'Beth': ['Dana']})
+        for seed in range(20):
+            stats = {}
+            repaired = repair_cycle(self.previous, index, random.Random(seed), stats)
+            self.assertEqual(stats['moved'], [])
+            self.assertEqual((repaired['Beth'], repaired['Fred']), ('Fred', 'Dana'))
+            self.assertEqual([giver for giver in self.previous if giver in repaired and repaired[giver] != self.previous[giver]], ['Beth'])
+
+    def test_split_cycles_are_invalid(self):
+        previous = {'Adam': 'Beth', 'Beth': 'Adam', 'Carl': 'Dana', 'Dana': 'Carl'}
+        stats = {}
+        self.assertIsNone(repair_cycle(previous, make_index(list(previous)), stats=stats))
+        self.assertEqual(stats['status'], INVALID)
+
+
+class LocalStorageTests(unittest.TestCase):
+
+    def test_backends_must_implement_storage(self):
+        class Incomplete(backends.LocalStorage):
+            def _read(self, bucket_name, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_filesystem_and_memory_agree(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(backends.MEMORY_OBJECTS.clear)
+        for storage in (MemoryStorage(), backends.FilesystemStorage(directory.name)):
+            for key in ('b.txt', 'a.txt', 'journals/c.jsonl'):
+                storage.upload_fileobj(io.BytesIO(key.encode()), BUCKET, key)
+            self.assertEqual(storage.get_object(Bucket=BUCKET, Key='a.txt', Range='bytes=2-4')['Body'].read(), b'txt')
+            first = storage.list_objects_v2(Bucket=BUCKET, MaxKeys=2)
+            self.assertEqual([item['Key'] for item in first['Contents']], ['a.txt', 'b.txt'])
+            rest = storage.list_objects_v2(Bucket=BUCKET, ContinuationToken=first['NextContinuationToken'])
+            self.assertEqual([item['Key'] for item in rest['Contents']], ['journals/c.jsonl'])
+            with self.assertRaises(BackendError) as error:
+                storage.get_object(Bucket=BUCKET, Key='missing.txt')
+            self.assertTrue(is_not_found(error.exception))
+
+
+class ArchiveTests(unittest.TestCase):
+
+    def test_index_round_trip(self):
+        people = names(300)
+        assignment = as_assignment(people)
+        data = build_index(assignment)
+        read_range = lambda start, end: data[start:end + 1]
+        for person in people:
+            self.assertEqual(lookup(read_range, person), assignment[person])
+        self.assertIsNone(lookup(read_range, 'Nobody'))
+
+    def test_unsupported_format(self):
+        data = b'{"format": "something-else", "version": 1}'.ljust(256)
+        with self.assertRaises(ValueError):
+            lookup(lambda start, end: data[start:end + 1], 'Adam')
+
+    def test_fetch_recipient_with_range_gets(self):
+        s3_client = MemoryStorage()
+        upload_index(s3_client, BUCKET, 'archive_test.txt.gz', {'Adam': 'Beth', 'Beth': 'Adam'})
+        self.assertEqual(fetch_recipient(s3_client, BUCKET, 'archive_test.txt.gz', 'Beth'), 'Adam')
+
+    def test_missing_index_is_not_found(self):
+        with self.assertRaises(BackendError) as error:
+            fetch_recipient(MemoryStorage(), BUCKET, 'no_such_file.txt.gz', 'Adam')
+        self.assertTrue(is_not_found(error.exception))
+        self.assertFalse(is_not_found(BackendError('AccessDenied', 'Access Denied', 403)))
+        self.assertFalse(is_not_found(ValueError('corrupt')))
+
+
+class RosterTests(unittest.TestCase):
+
+    def test_json_lines(self):
+        roster = read_json_lines(io.StringIO(
+            '{"name": "Adam", "phone_number": "+1", "constraints": ["Beth"]}\n'
+            '\n'
+            '{"name": "Beth", "phone_number": "+2"}\n'
+        ))
+        self.assertEqual(roster.names, ['Adam', 'Beth'])
+        self.assertEqual(roster['Adam'].constraints, ('Beth',))
+        self.assertEqual(roster.phone_number('Beth'), '+2')
+
+    def test_json_lines_errors_name_the_line(self):
+        bad_files = (
+            '{"name": "Adam", "phone_number": "+1"}\n{"name": "Beth"\n',
+            '{"name": "Adam", "phone_number": "+1"}\n{"name": "Beth"}\n',
+            '{"name": "Adam", "phone_number": "+1"}\n{"name": "Adam", "phone_number": "+2"}\n',
+        )
+        for content in bad_files:
+            with self.assertRaisesRegex(ValueError, '^line 2: '):
+                read_json_lines(io.StringIO(content))
+
+    def test_csv(self):
+        roster = read_csv(io.StringIO('name,phone_number,constraints\nAdam,+1,Beth; Carl\nBeth,+2,\n'))
+        self.assertEqual(roster.names, ['Adam', 'Beth'])
+        self.assertEqual(roster['Adam'].constraints, ('Beth', 'Carl'))
+        self.assertEqual(roster['Beth'].constraints, ())
+
+    def test_csv_errors(self):
+        with self.assertRaisesRegex(ValueError, 'missing CSV column'):
+            read_csv(io.StringIO('name,constraints\nAdam,\n'))
+        with self.assertRaisesRegex(ValueError, '^line 3: '):
+            read_csv(io.StringIO('name,phone_number\nAdam,+1\nAdam,+2\n'))
+        with self.assertRaisesRegex(ValueError, '^line 2: '):
+            read_csv(io.StringIO('name,phone_number\nAdam\n'))
+
+    def test_people_data_round_trip(self):
+        people_data = {'Adam': {'phone_number': '+1', 'constraints': ['Beth']}, 'Beth': {'phone_number': '+2', 'constraints': []}}
+        self.assertEqual(Roster.from_people_data(people_data).to_people_data(), people_data)
+
+
+class FeasibilityTests(unittest.TestCase):
+
+    def test_feasible_roster(self):
+        index = make_index(['Adam', 'Beth', 'Carl'])
+        self.assertEqual(check_feasibility(index), [])
+
+    def test_nobody_to_give_to(self):
+        index = make_index(['Adam', 'Beth', 'Carl'], {'Adam': ['Beth', 'Carl']})
+        problems = check_feasibility(index)
+        self.assertTrue(any('Adam' in problem for problem in problems))
+        self.assertFalse(any('Adam' in problem for problem in check_feasibility(index, hide_names=True)))
+
+    def test_too_few_recipients(self):
+        index = make_index(['Adam', 'Beth', 'Carl', 'Dana'], {'Adam': ['Beth', 'Dana'], 'Beth': ['Adam', 'Dana']})
+        self.assertIn('2 givers can only give to 1 recipient', check_feasibility(index)[0])
+
+    def test_split_groups(self):
+        people = ['Adam', 'Beth', 'Carl', 'Dana']
+        index = make_index(people, {'Adam': ['Carl', 'Dana'], 'Beth': ['Carl', 'Dana'], 'Carl': ['Adam', 'Beth'], 'Dana': ['Adam', 'Beth']})
+        self.assertTrue(any('2 groups' in problem for problem in check_feasibility(index)))
+
+    def test_unknown_constraint_warning(self):
+        index = make_index(['Adam', 'Beth'], {'Adam': ['Zed']})
+        self.assertEqual(constraint_warnings(index), ['Adam has constraints on unknown people: Zed'])
+
+
+class ValidationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = make_index(['Adam', 'Beth', 'Carl', 'Dana'], {'Adam': ['Beth']})
+
+    def test_valid_assignment(self):
+        issues = assignment_issues({'Adam': 'Carl', 'Carl': 'Beth', 'Beth': 'Dana', 'Dana': 'Adam'}, self.index)
+        self.assertEqual(issues['cycles'], 1)
+        for key in ('unknown', 'self_gifting', 'forbidden', 'missing_givers', 'missing_recipients', 'duplicate_recipients'):
+            self.assertEqual(issues[key], [])
+
+    def test_every_problem_is_reported(self):
+        issues = assignment_issues({'Adam': 'Beth', 'Beth': 'Beth', 'Carl': 'Beth', 'Zed': 'Adam'}, self.index)
+        self.assertEqual(issues['unknown'], ['Zed'])
+        self.assertEqual(issues['self_gifting'], ['Beth'])
+        self.assertEqual(issues['forbidden'], [('Adam', 'Beth')])
+        self.assertEqual(issues['missing_givers'], ['Dana'])
+        self.assertEqual(issues['duplicate_recipients'], ['Beth'])
+        self.assertIsNone(issues['cycles'])
+
+    def test_two_cycles(self):
+        issues = assignment_issues({'Adam': 'Carl', 'Carl': 'Adam', 'Beth': 'Dana', 'Dana': 'Beth'}, self.index)
+        self.assertEqual(issues['cycles'], 2)
+
+    def test_batch_check(self):
+        good, _ = encode_assignment({'Adam': 'Carl', 'Carl': 'Beth', 'Beth': 'Dana', 'Dana': 'Adam'}, self.index)
+        forbidden, _ = encode_assignment({'Adam': 'Beth', 'Beth': 'Carl', 'Carl': 'Dana', 'Dana': 'Adam'}, self.index)
+        split, _ = encode_assignment({'Adam': 'Carl', 'Carl': 'Adam', 'Beth': 'Dana', 'Dana': 'Beth'}, self.index)
+        self.assertEqual([bool(valid) for valid in check_permutations([good, forbidden, split], self.index)['valid']], [True, False, False])
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_replay(self):
+        journal = SendJournal('run', directory=self.directory.name)
+        jobs = [{'person': 'Adam', 'to': '+1', 'body': 'hi'}, {'person': 'Beth', 'to': '+2', 'body': 'hi'}]
+        journal.record_assignment(jobs)
+        journal.record_upload('file.txt.gz')
+        journal.record_sending(jobs[0])
+        journal.record_result({'person': 'Adam', 'status': 'sent', 'sid': 'SM1'})
+        journal.record_sending(jobs[1])
+
+        state = SendJournal('run', directory=self.directory.name).load()
+        self.assertEqual(state['jobs'], jobs)
+        self.assertEqual(state['status'], {'Adam': 'sent', 'Beth': 'in-flight'})
+        self.assertEqual(state['sids'], {'Adam': 'SM1'})
+        self.assertEqual(state['file_name'], 'file.txt.gz')
+
+    def test_torn_tail_is_dropped(self):
+        journal = SendJournal('torn', directory=self.directory.name)
+        journal.record_assignment([{'person': 'Adam'}])
+        with open(journal.path, 'a') as journal_file:
+            journal_file.write('{"event": "sent", "per')
+        self.assertEqual(journal.load()['status'], {})
+        journal.record_sending({'person': 'Adam'})
+        self.assertEqual(journal.load()['status'], {'Adam': 'in-flight'})
+
+    def test_every_result_reaches_s3(self):
+        # With --rm containers the local journal is gone after a crash, so S3 must be up to date
+        s3_client = MemoryStorage()
+        self.addCleanup(backends.MEMORY_OBJECTS.clear)
+        journal = SendJournal('mirrored', s3_client, directory=self.directory.name)
+        journal.record_assignment([{'person': 'Adam'}, {'person': 'Beth'}])
+        journal.record_sending({'person': 'Adam'})
+        journal.record_result({'person': 'Adam', 'status': 'sent', 'sid': 'SM1'})
+        os.remove(journal.path)
+
+        state = SendJournal('mirrored', s3_client, directory=self.directory.name).load()
+        self.assertEqual(state['status'], {'Adam': 'sent'})
+
+    def test_missing_journal(self):
+        self.assertIsNone(SendJournal('missing', directory=self.directory.name).load())
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.s3_client = MemoryStorage()
+        self.cache = AssignmentCache(directory.name, max_bytes=1024 * 1024, ttl=0)
+        self.s3_client.upload_fileobj(io.BytesIO(b'first'), BUCKET, 'cache_test.txt')
+
+    def test_revalidates_and_refetches(self):
+        self.assertEqual(self.cache.get(self.s3_client, BUCKET, 'cache_test.txt'), b'first')
+        with mock.patch.object(self.s3_client, 'get_object', wraps=self.s3_client.get_object) as get_object:
+            self.assertEqual(self.cache.get(self.s3_client, BUCKET, 'cache_test.txt'), b'first')
+            self.assertIn('IfNoneMatch', get_object.call_args.kwargs)
+        self.s3_client.upload_fileobj(io.BytesIO(b'second'), BUCKET, 'cache_test.txt')
+        self.assertEqual(self.cache.get(self.s3_client, BUCKET, 'cache_test.txt'), b'second')
+
+    def test_not_modified(self):
+        self.assertTrue(is_not_modified(BackendError('304', 'Not Modified', 304)))
+        self.assertFalse(is_not_modified(BackendError('NoSuchKey', 'missing', 404)))
+
+    def test_eviction(self):
+        small = AssignmentCache(self.cache.directory, max_bytes=8, ttl=0)
+        self.s3_client.upload_fileobj(io.BytesIO(b'another'), BUCKET, 'cache_test_2.txt')
+        small.get(self.s3_client, BUCKET, 'cache_test.txt')
+        path = small.path(self.s3_client, BUCKET, 'cache_test_2.txt')
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+
+class HistoryTests(unittest.TestCase):
+
+    def test_latest_file_of_the_year_wins(self):
+        history = empty_history()
+        self.assertTrue(add_assignment(history, '2024-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Beth'}))
+        self.assertTrue(add_assignment(history, '2024-12-01_12-00-00_gift_assignments_v2.txt.gz', {'Adam': 'Carl'}))
+        self.assertFalse(add_assignment(history, '2024-11-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Dana'}))
+        self.assertFalse(add_assignment(history, '2024-12-02_12-00-00_gift_assignments_dryrun.txt.gz', {'Adam': 'Dana'}))
+        self.assertEqual(history['years']['2024']['pairs'], {'Adam': 'Carl'})
+
+    def test_past_recipients_become_constraints(self):
+        history = empty_history()
+        add_assignment(history, '2023-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Beth'})
+        add_assignment(history, '2024-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Carl', 'Beth': 'Zed'})
+        self.assertEqual(past_recipients(history, 1, current_year=2025), {'Adam': {'Carl'}, 'Beth': {'Zed'}})
+        self.assertEqual(past_recipients(history, 2, current_year=2025)['Adam'], {'Beth', 'Carl'})
+
+        roster = Roster.from_people_data({name: {'phone_number': '+1', 'constraints': []} for name in ('Adam', 'Beth', 'Carl')})
+        constraints = merge_constraints(roster, past_recipients(history, 2, current_year=2025))
+        self.assertEqual(constraints, {'Adam': ['Beth', 'Carl'], 'Beth': [], 'Carl': []})
+
+    def test_sync_reads_new_files_only(self):
+        s3_client = MemoryStorage()
+        for file_name, assignment in (('2023-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Beth', 'Beth': 'Adam'}),
+                                      ('2024-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Carl', 'Carl': 'Adam'})):
+            file_object = io.BytesIO()
+            write_assignment_data(''.join(f"{giver} -> {recipient}\n" for giver, recipient in assignment.items()), file_object)
+            file_object.seek(0)
+            s3_client.upload_fileobj(file_object, BUCKET, file_name)
+
+        history = empty_history()
+        add_assignment(history, '2023-12-01_12-00-00_gift_assignments.txt.gz', {'Adam': 'Beth', 'Beth': 'Adam'})
+        self.assertEqual(sync_history(s3_client, BUCKET, history), 1)
+        self.assertEqual(history['years']['2024']['pairs'], {'Adam': 'Carl', 'Carl': 'Adam'})
+        self.assertEqual(stream_assignments(s3_client, BUCKET, history['last_key']), {'Adam': 'Carl', 'Carl': 'Adam'})
+
+    def tearDown(self):
+        backends.MEMORY_OBJECTS.clear()
+
+
+class DispatchTests(unittest.TestCase):
+
+    def test_zero_rate_limit_means_no_limit(self):
+        sent = []
+        dispatcher = SmsDispatcher(LocalSmsClient(sent.append), from_number='+10000000000', max_workers=2, rate_limit=0)
+        self.assertIsNone(dispatcher.bucket)
+        results = dispatcher.send_all([{'person': name, 'to': '+1', 'body': 'hi'} for name in ('Adam', 'Beth', 'Carl')])
+        self.assertEqual([result['status'] for result in results], ['sent'] * 3)
+        self.assertEqual(len(sent), 3)
+
+
+class AssignmentFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.main = load_main_module()
+        self.roster = Roster.from_people_data({'Adam': {'phone_number': '+1'}, 'Beth': {'phone_number': '+2'}})
+        self.assignment = {'Adam': 'Beth', 'Beth': 'Adam'}
+
+    def file_text(self, **kwargs):
+        return ''.join(self.main.assignment_file_data(self.assignment, self.roster, False, **kwargs))
+
+    def test_seed_hint(self):
+        self.assertIn('run with --seed 42 and the same roster to reproduce', self.file_text(seed=42))
+        self.assertNotIn('Solver seed', self.file_text())
+
+    def test_seed_hint_includes_the_history_years(self):
+        text = self.file_text(seed=42, history_years=2)
+        self.assertIn('run with --seed 42 --avoid-repeats 2, the same roster and the same pairing history', text)
+
+    def test_gzip_upload_round_trip(self):
+        s3_client = MemoryStorage()
+        self.addCleanup(backends.MEMORY_OBJECTS.clear)
+        people = names(2000)
+        assignment = as_assignment(people)
+        roster = Roster()
+        for person in people:
+            roster.add(person, '+1')
+        # A small spool forces the temporary file onto disk part way through
+        with mock.patch.object(helper, 'UPLOAD_SPOOL_BYTES', 4096):
+            file_name = upload_assignment_data_to_s3(s3_client, self.main.assignment_file_data(assignment, roster, True, seed=7),
+                                                     True, False, assignment, 'round_trip_dryrun.txt.gz')
+
+        stored = s3_client.get_object(Bucket=BUCKET, Key=file_name)['Body'].read()
+        text = ''.join(self.main.assignment_file_data(assignment, roster, True, seed=7)).encode()
+        self.assertEqual(stored[:2], b'\x1f\x8b')
+        self.assertLess(len(stored), len(text) // 4)
+        self.assertEqual(decompressed(io.BytesIO(stored), file_name).read(), text)
+        self.assertEqual(stream_assignments(s3_client, BUCKET, file_name), assignment)
+        self.assertEqual(stream_assignments(s3_client, BUCKET, file_name, ['Person5', 'Person1999']),
+                         {'Person5': 'Person6', 'Person1999': 'Person0'})
+        self.assertEqual(fetch_recipient(s3_client, BUCKET, file_name, 'Person42'), 'Person43')
+
+    def test_plain_text_files_still_work(self):
+        s3_client = MemoryStorage()
+        self.addCleanup(backends.MEMORY_OBJECTS.clear)
+        upload_assignment_data_to_s3(s3_client, 'Adam -> Beth\nBeth -> Adam\n', file_name='old_gift_assignments.txt')
+        self.assertEqual(s3_client.get_object(Bucket=BUCKET, Key='old_gift_assignments.txt')['Body'].read(), b'Adam -> Beth\nBeth -> Adam\n')
+        self.assertEqual(stream_assignments(s3_client, BUCKET, 'old_gift_assignments.txt'), self.assignment)
+
+
+class MetricsTests(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual([percentile(samples, q) for q in (50, 90, 99, 100)], [50, 90, 99, 100])
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_phases_counts_and_values(self):
+        run = Metrics()
+        run.begin_phase('load')
+        run.begin_phase('generate')
+        run.begin_phase('load')
+        run.count('sms_sent')
+        run.count('s3_bytes_uploaded', 100)
+        run.count('s3_bytes_uploaded', 50)
+        run.set('people', 7)
+        summary = run.summary()
+        self.assertEqual(set(summary['phases']), {'load', 'generate'})
+        self.assertEqual(summary['counts'], {'sms_sent': 1, 's3_bytes_uploaded': 150})
+        self.assertEqual(summary['values'], {'people': 7})
+        self.assertIsNone(run.current_phase)
+
+    def test_counts_from_many_threads(self):
+        run = Metrics()
+        threads = [threading.Thread(target=lambda: [run.count('calls') for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(run.summary()['counts']['calls'], 8000)
+
+    def test_timed_client_records_every_call(self):
+        run = Metrics()
+        client = run.instrument(MemoryStorage(), 's3')
+        self.addCleanup(backends.MEMORY_OBJECTS.clear)
+        client.upload_fileobj(io.BytesIO(b'data'), BUCKET, 'metrics_test.txt')
+        self.assertEqual(client.get_object(Bucket=BUCKET, Key='metrics_test.txt')['Body'].read(), b'data')
+        # Failed calls are timed too
+        with self.assertRaises(BackendError):
+            client.get_object(Bucket=BUCKET, Key='missing.txt')
+        latencies = run.summary()['latencies']
+        self.assertEqual(latencies['s3.upload_fileobj']['calls'], 1)
+        self.assertEqual(latencies['s3.get_object']['calls'], 2)
+        self.assertLessEqual(latencies['s3.get_object']['p50'], latencies['s3.get_object']['max'])
+
+    def test_summary_is_json(self):
+        run = Metrics()
+        run.observe('twilio.messages.create', 0.25)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            run.write(path)
+            with open(path) as metrics_file:
+                summary = json.load(metrics_file)
+        self.assertEqual(summary['latencies']['twilio.messages.create']['p99'], 0.25)
+
+
+class StartupTests(unittest.TestCase):
+
+    def run_python(self, *args):
+        return subprocess.run([sys.executable, *args], cwd=HERE, capture_output=True, text=True, check=True)
+
+    def test_report_lists_first_time_imports(self):
+        stderr = self.run_python('xmas-xchange.py', '--check-feasibility', '--data', 'json/data.example.json', '--startup-report').stderr
+        self.assertIn('Startup report', stderr)
+        self.assertIn('Total import time', stderr)
+        # The SDKs are only imported once a client is built
+        self.assertNotIn('boto3', stderr)
+        self.assertNotIn('twilio', stderr)
+
+    def test_hook_is_only_installed_with_the_flag(self):
+        code = "import builtins, startup; print(builtins.__import__ is startup._original_import)"
+        self.assertEqual(self.run_python('-c', code).stdout.strip(), 'True')
+        self.assertEqual(self.run_python('-c', code, '--startup-report').stdout.strip(), 'False')
+
+    def test_depth_is_tracked_per_thread(self):
+        code = (
+            "import startup, threading\n"
+            "threads = [threading.Thread(target=__import__, args=(name,)) for name in ('decimal', 'fractions', 'statistics', 'xml.dom.minidom')]\n"
+            "[thread.start() for thread in threads]\n"
+            "[thread.join() for thread in threads]\n"
+            "print(sorted(name for _, depth, name, _ in startup.imports if depth == 1))\n"
+        )
+        stdout = self.run_python('-c', code, '--startup-report').stdout
+        self.assertEqual(stdout.strip(), "['decimal', 'fractions', 'statistics', 'xml.dom.minidom']")
+
+
+class BatchTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.rosters = os.path.join(self.directory, 'rosters')
+        os.mkdir(self.rosters)
+        self.write('family.json', '{"Adam": {"phone_number": "+1", "constraints": ["Beth"]}, "Beth": {"phone_number": "+2", "constraints": []}, "Carl": {"phone_number": "+3", "constraints": []}}')
+        self.write('work team.csv', 'name,phone_number,constraints\nDana,+4,\nEvan,+5,\n')
+        self.write('notes.txt', 'not a roster')
+
+    def write(self, name, content):
+        path = os.path.join(self.rosters, name)
+        with open(path, 'w') as roster_file:
+            roster_file.write(content)
+        return path
+
+    def test_find_rosters(self):
+        expected = [('family', os.path.join(self.rosters, 'family.json')), ('work_team', os.path.join(self.rosters, 'work team.csv'))]
+        self.assertEqual(batch.find_rosters(self.rosters), expected)
+
+        manifest = os.path.join(self.directory, 'manifest.txt')
+        with open(manifest, 'w') as manifest_file:
+            manifest_file.write('# exchanges\nrosters/family.json\n\nrosters/work team.csv\n')
+        self.assertEqual(batch.find_rosters(manifest), expected)
+
+    def test_solve_exchange(self):
+        result = batch.solve_exchange(os.path.join(self.rosters, 'family.json'))
+        self.assertEqual(result['solver']['status'], FOUND)
+        self.assertTrue(make_index(result['roster'].names, result['roster'].constraints()).check(result['assignment']))
+
+        # Two people who exclude each other
+        infeasible = batch.solve_exchange(self.write('pair.json', '{"Adam": {"phone_number": "+1", "constraints": ["Beth"]}, "Beth": {"phone_number": "+2", "constraints": []}}'))
+        self.assertEqual((infeasible['assignment'], infeasible['solver']['status']), (None, INFEASIBLE))
+        self.assertTrue(infeasible['problems'])
+
+        unreadable = batch.solve_exchange(self.write('broken.jsonl', '{"name": "Adam"}\n'))
+        self.assertEqual(unreadable['solver']['status'], 'unreadable')
+        self.assertIn('line 1', unreadable['problems'][0])
+
+    def test_prepare_exchange_keeps_the_seed_out_of_the_report(self):
+        result = batch.solve_exchange(os.path.join(self.rosters, 'family.json'))
+        exchange, assignment_data, jobs = batch.prepare_exchange('family', result, False)
+        self.assertNotIn('seed', exchange['solver'])
+        self.assertTrue(exchange['file_name'].startswith('family/'))
+        self.assertIn(f"Solver seed: {result['solver']['seed']}", ''.join(assignment_data))
+        self.assertEqual(sorted(job['person'] for job in jobs), ['Adam', 'Beth', 'Carl'])
+        self.assertEqual(batch.prepare_exchange('family', result, True)[2], [])
+
+    def test_batch_run(self):
+        # The memory backends don't outlive the process, so keep the files on disk
+        env = dict(os.environ, STORAGE_BACKEND='fs', STORAGE_DIR=os.path.join(self.directory, 'storage'),
+                   SMS_BACKEND='log', SMS_LOG_PATH=os.path.join(self.directory, 'sms_log.jsonl'),
+                   JOURNAL_DIR=os.path.join(self.directory, 'journal'), TWILIO_PHONE_NUMBER='+10000000000', SMS_RATE_LIMIT='0')
+        report = os.path.join(self.directory, 'report.json')
+        process = subprocess.run([sys.executable, os.path.join(HERE, 'batch.py'), self.rosters, '--workers', '1', '--report', report],
+                                 cwd=self.directory, env=env, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 0, process.stdout + process.stderr)
+        with open(report) as report_file:
+            summary = json.load(report_file)
+        self.assertEqual((summary['sent'], summary['failed']), (5, 0))
+        self.assertEqual([exchange['name'] for exchange in summary['exchanges']], ['family', 'work_team'])
+        for exchange in summary['exchanges']:
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'storage', BUCKET, exchange['file_name'])))
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, 'journal'))), 2)
+
+
+class ServiceSessionTests(unittest.TestCase):
+
+    def check(self, session):
+        with redirect_stdout(io.StringIO()) as output:
+            passed = session.check_connections()
+        return passed, output.getvalue()
+
+    def test_clients_are_built_independently(self):
+        # Building the S3 client can't finish until the Twilio one exists, so a shared lock would time out
+        twilio_built = threading.Event()
+
+        def setup_s3_client():
+            self.assertTrue(twilio_built.wait(5))
+            return 's3'
+
+        def setup_twilio_client():
+            twilio_built.set()
+            return 'twilio'
+
+        with mock.patch('session.setup_s3_client', setup_s3_client), \
+                mock.patch('session.setup_twilio_client', setup_twilio_client), \
+                mock.patch('session.test_s3_connection', lambda client: client == 's3'), \
+                mock.patch('session.test_twilio_connection', lambda client: client == 'twilio'):
+            self.assertEqual(self.check(ServiceSession(timeout=5)), (True, ''))
+
+    def test_checks_run_at_the_same_time(self):
+        def slow_check(client):
+            time.sleep(0.3)
+            return True
+
+        with mock.patch('session.setup_s3_client', object), mock.patch('session.setup_twilio_client', object), \
+                mock.patch('session.test_s3_connection', slow_check), mock.patch('session.test_twilio_connection', slow_check):
+            start = time.monotonic()
+            self.assertTrue(self.check(ServiceSession(timeout=5))[0])
+            self.assertLess(time.monotonic() - start, 0.55)
+
+    def test_check_without_an_answer_times_out(self):
+        never = threading.Event()
+        self.addCleanup(never.set)
+        with mock.patch('session.setup_s3_client', object), mock.patch('session.setup_twilio_client', object), \
+                mock.patch('session.test_s3_connection', lambda client: never.wait()), \
+                mock.patch('session.test_twilio_connection', lambda client: True):
+            start = time.monotonic()
+            passed, output = self.check(ServiceSession(timeout=0.2))
+        self.assertFalse(passed)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIn('S3 connection failed: no answer within 0.2 seconds', output)
+
+    def test_client_setup_errors_fail_the_check(self):
+        def broken():
+            raise ValueError('TWILIO_ACCOUNT_SID not found')
+
+        with mock.patch('session.setup_s3_client', object), mock.patch('session.setup_twilio_client', broken), \
+                mock.patch('session.test_s3_connection', lambda client: True):
+            passed, output = self.check(ServiceSession(timeout=5))
+        self.assertFalse(passed)
+        self.assertIn('Twilio connection failed: TWILIO_ACCOUNT_SID not found', output)
+
+    def test_clients_are_built_once(self):
+        with mock.patch('session.setup_s3_client', side_effect=object) as setup_s3_client:
+            session = ServiceSession()
+            clients = set()
+            threads = [threading.Thread(target=lambda: clients.add(id(session.s3_client))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(setup_s3_client.call_count, 1)
+
+
+class SimulateTests(unittest.TestCase):
+
+    def test_seeded_simulation_repeats(self):
+        index = make_index(['Adam', 'Beth', 'Carl', 'Dana', 'Evan'], {'Adam': ['Beth']})
+        first = run_simulation(index, 50, workers=1, seed=7)
+        second = run_simulation(index, 50, workers=1, seed=7)
+        self.assertEqual(first['statuses'], {FOUND: 50})
+        self.assertEqual(first['methods'], {REJECTION_SAMPLING: 50})
+        self.assertEqual(first['invalid'], 0)
+        self.assertEqual([list(row) for row in first['matrix']], [list(row) for row in second['matrix']])
+        # Adam never gives to Beth or himself, and everyone gives once per run
+        self.assertEqual(first['matrix'][0][1], 0)
+        self.assertEqual([sum(row) for row in first['matrix']], [50] * 5)
+
+    def test_main_module_skips_numpy(self):
+        # Only --simulate needs NumPy, so everything else starts without it
+        code = "import sys; from helper import load_main_module; load_main_module(); print('numpy' in sys.modules, 'simulate' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['False', 'False'])
+
+    def test_uniformity(self):
+        index = make_index(['Adam', 'Beth', 'Carl'])
+        result = uniformity([[0, 50, 50], [50, 0, 50], [50, 50, 0]], index)
+        self.assertEqual(result['chi2'], 0)
+        self.assertGreater(result['p_value'], 0.99)
+        skewed = uniformity([[0, 100, 0], [0, 0, 100], [100, 0, 0]], index)
+        self.assertLess(skewed['p_value'], 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Assignment validation engine.
+
+An assignment is encoded as an integer permutation array (perm[giver_id] is
+the recipient's id, -1 when the giver is missing) using the ids of a
+ConstraintIndex. All checks then run as whole-array passes: permutation
+validity, no self-gifting, no forbidden pairs and a single gift cycle. Many
+assignments can be validated at once by stacking them into a 2D array.
+
+NumPy is optional; without it the same checks run in plain Python.
+"""
+
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def encode_assignment(assignment, index):
+    """Return (perm, unknown): the assignment as a list of recipient ids and any names not in the index"""
+    ids = index.ids
+    perm = [-1] * len(index)
+    unknown = []
+    for person, recipient in assignment.items():
+        giver_id = ids.get(person)
+        recipient_id = ids.get(recipient)
+        if giver_id is None:
+            unknown.append(person)
+        elif recipient_id is None:
+            unknown.append(recipient)
+        else:
+            perm[giver_id] = recipient_id
+    return perm, unknown
+
+
+def forbidden_keys(index):
+    """Return every forbidden (giver, recipient) pair as a sorted array of giver * n + recipient"""
+    n = len(index)
+    keys = [giver * n + recipient for giver, excluded in enumerate(index.forbidden) for recipient in excluded]
+    return np.array(sorted(keys), dtype=np.int64)
+
+
+def _cycle_labels(perms):
+    """Label every id with the smallest id on its cycle using pointer doubling (rows must be permutations)"""
+    n = perms.shape[1]
+    labels = np.broadcast_to(np.arange(n), perms.shape).copy()
+    jump = perms.copy()
+    for _ in range(max(1, int(np.ceil(np.log2(n)))) + 1):
+        labels = np.minimum(labels, np.take_along_axis(labels, jump, axis=1))
+        jump = np.take_along_axis(jump, jump, axis=1)
+    return labels
+
+
+def check_permutations(perms, index, keys=None):
+    """
+    Validate a batch of encoded assignments in vectorized passes.
+
+    perms is an (m, n) integer array (or a single length-n row). Returns a dict
+    of length-m boolean arrays: 'permutation', 'no_self', 'no_forbidden',
+    'single_cycle' and 'valid' (all of them). Pass keys from forbidden_keys()
+    to reuse them across calls.
+    """
+    if np is None:
+        rows = [list(row) for row in perms] if perms and isinstance(perms[0], (list, tuple)) else [list(perms)]
+        results = [_check_row_python(row, index) for row in rows]
+        return {name: [result[name] for result in results] for name in results[0]} if results else {}
+
+    perms = np.atleast_2d(np.asarray(perms, dtype=np.int64))
+    m, n = perms.shape
+    ids = np.arange(n)
+    keys = forbidden_keys(index) if keys is None else keys
+
+    permutation = (np.sort(perms, axis=1) == ids).all(axis=1)
+    no_self = ~(perms == ids).any(axis=1)
+    present = perms >= 0
+    pair_keys = ids * n + perms
+    no_forbidden = ~(np.isin(pair_keys, keys) & present).any(axis=1)
+
+    # Cycle structure only means something for rows that are permutations
+    safe = np.where(permutation[:, None], perms, ids)
+    single_cycle = permutation & (_cycle_labels(safe) == 0).all(axis=1)
+
+    return {
+        'permutation': permutation,
+        'no_self': no_self,
+        'no_forbidden': no_forbidden,
+        'single_cycle': single_cycle,
+        'valid': permutation & no_self & no_forbidden & single_cycle,
+    }
+
+
+def _count_cycles(perm):
+    """Count the cycles of a permutation given as a list"""
+    seen = [False] * len(perm)
+    cycles = 0
+    for start in range(len(perm)):
+        if seen[start]:
+            continue
+        cycles += 1
+        current = start
+        while not seen[current]:
+            seen[current] = True
+            current = perm[current]
+    return cycles
+
+
+def _check_row_python(perm, index):
+    """Plain Python version of check_permutations for a single row"""
+    n = len(perm)
+    forbidden = index.forbidden
+    permutation = sorted(perm) == list(range(n))
+    no_self = all(recipient != giver for giver, recipient in enumerate(perm))
+    no_forbidden = all(recipient not in forbidden[giver] for giver, recipient in enumerate(perm) if recipient >= 0)
+    single_cycle = permutation and n > 0 and _count_cycles(perm) == 1
+    return {
+        'permutation': permutation,
+        'no_self': no_self,
+        'no_forbidden': no_forbidden,
+        'single_cycle': single_cycle,
+        'valid': permutation and no_self and no_forbidden and single_cycle,
+    }
+
+
+def assignment_issues(assignment, index):
+    """
+    Find every problem with one person -> recipient assignment.
+
+    Returns a dict of lists of names ('unknown', 'self_gifting',
+    'missing_givers', 'missing_recipients', 'duplicate_recipients'), the
+    forbidden (giver, recipient) pairs under 'forbidden', and the number of
+    separate gift cycles under 'cycles' (None if it isn't a permutation).
+    """
+    perm, unknown = encode_assignment(assignment, index)
+    people = index.people
+    n = len(people)
+
+    if np is not None:
+        row = np.array(perm, dtype=np.int64)
+        ids = np.arange(n)
+        present = row >= 0
+        counts = np.bincount(row[present], minlength=n)
+        self_gifting = np.flatnonzero(row == ids)
+        bad = present & np.isin(ids * n + row, forbidden_keys(index))
+        forbidden_pairs = [(people[g], people[row[g]]) for g in np.flatnonzero(bad)]
+        missing_givers = np.flatnonzero(~present)
+        missing_recipients = np.flatnonzero(counts == 0)
+        duplicates = np.flatnonzero(counts > 1)
+        is_permutation = not missing_givers.size and not duplicates.size
+        cycles = int(np.unique(_cycle_labels(row[None, :])[0]).size) if is_permutation and n else None
+    else:
+        counts = Counter(recipient for recipient in perm if recipient >= 0)
+        self_gifting = [giver for giver, recipient in enumerate(perm) if recipient == giver]
+        forbidden_pairs = [
+            (people[giver], people[recipient]) for giver, recipient in enumerate(perm)
+            if recipient >= 0 and recipient in index.forbidden[giver]
+        ]
+        missing_givers = [giver for giver, recipient in enumerate(perm) if recipient < 0]
+        missing_recipients = [i for i in range(n) if counts[i] == 0]
+        duplicates = [i for i, count in counts.items() if count > 1]
+        is_permutation = not missing_givers and not duplicates
+        cycles = _count_cycles(perm) if is_permutation and n else None
+
+    return {
+        'unknown': unknown,
+        'self_gifting': [people[i] for i in self_gifting],
+        'forbidden': forbidden_pairs,
+        'missing_givers': [people[i] for i in missing_givers],
+        'missing_recipients': [people[i] for i in missing_recipients],
+        'duplicate_recipients': [people[i] for i in duplicates],
+        'cycles': cycles,
+    }
@@ -1,37 +1,149 @@
-import argparse, json, random
+import startup  # first, so --startup-report can time the imports below
+import argparse
+import json
+import random
 from decouple import config
-from helper import (
-    setup_s3_client, setup_twilio_client, test_s3_connection, test_twilio_connection,
-    upload_assignment_data_to_s3, Colors
-)
+from helper import upload_assignment_data_to_s3, stream_assignments, next_version_file_name, Colors
+from session import ServiceSession
+from constraints import ConstraintIndex
+from roster import load_roster
+from dispatch import SmsDispatcher, write_report
+from journal import SendJournal, new_run_id
+from feasibility import check_feasibility, constraint_warnings
+from solver import find_gift_cycle, find_gift_cycle_parallel, new_seed, repair_cycle, INFEASIBLE, INVALID
+from history import load_history, save_history, sync_history, past_recipients, merge_constraints, update_history
+from metrics import metrics, write_metrics_at_exit, profile_until_exit
+
+DEFAULT_DATA_PATH = 'json/data.json'
+DRY_RUN_BANNER = "---------------------------- DRY RUN ----------------------------\n\n"
 
 def parse_arguments():
     """Parse command-line arguments"""
     parser = argparse.ArgumentParser(description='Send Christmas Gift Exchange text messages')
+    parser.add_argument('--data', metavar='PATH', default=DEFAULT_DATA_PATH, help=f'Roster of participants as .json, .jsonl or .csv (default: {DEFAULT_DATA_PATH}).')
     parser.add_argument('--dry-run', action='store_true', help='Do a dry-run without sending SMS messages to the recipients.')
     parser.add_argument('--hide-sensitive-output', action='store_true', help='Hide output messages that contain names and phone numbers (useful in GitHub actions).')
     parser.add_argument('--github-test', action='store_true', help='This is used to tell the script that it is being run from GitHub actions so it will do some things differently.')
-    return parser.parse_args()
+    parser.add_argument('--sms-report', metavar='PATH', help='Write a JSON report with the delivery result of every SMS message to PATH.')
+    parser.add_argument('--resume', metavar='RUN_ID', help='Resume an interrupted run from its send journal, only sending the messages that were not sent yet.')
+    parser.add_argument('--repair', metavar='FILE_NAME', help='Update an earlier assignment file in S3 for people who joined or dropped out of the roster, only texting the givers whose recipient changed.')
+    parser.add_argument('--avoid-repeats', metavar='YEARS', type=int, default=0, help='Avoid giving to anyone you gave to in the last YEARS years (from the pairing history in S3) where the constraints allow it.')
+    parser.add_argument('--seed', type=int, help='Seed for the assignment search. Reruns with the seed recorded in an assignment file (and the same roster) reproduce that assignment.')
+    parser.add_argument('--parallel-solvers', metavar='N', type=int, default=1, help='Run N independently seeded searches in parallel processes and keep the first assignment found (ignored with --seed).')
+    parser.add_argument('--check-feasibility', action='store_true', help='Only check that the roster allows a valid gift exchange, without connecting to S3 or Twilio.')
+    parser.add_argument('--simulate', metavar='N', type=int, help='Generate N assignments without connecting to S3 or Twilio and report how evenly recipients come up and how long generation takes (uses --parallel-solvers processes, default one per CPU core).')
+    parser.add_argument('--simulate-report', metavar='PATH', help='With --simulate, write the giver x recipient counts, chi-square results and generation times to PATH as JSON.')
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write the time spent in each phase, counters and S3/Twilio call latencies to PATH as JSON.')
+    parser.add_argument('--profile', metavar='PATH', help='Profile the run with cProfile and write the stats to PATH (view them with python -m pstats PATH).')
+    parser.add_argument(startup.STARTUP_REPORT_FLAG, action='store_true', help='Print how long each module took to import (including the S3 and Twilio SDKs) to stderr when done.')
+    args = parser.parse_args()
+    if args.simulate is not None:
+        # --simulate must never fall through to a real run
+        if args.simulate < 1:
+            parser.error('--simulate needs at least 1 assignment')
+        if args.resume or args.repair:
+            parser.error('--simulate cannot be combined with --resume or --repair')
+    return args
+
+def load_people_data(path):
+    """Load the roster of participants from a .json, .jsonl or .csv file"""
+    try:
+        return load_roster(path)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not load the roster from {path}: {e}")
+        exit(1)
 
-def load_people_data():
-    """Load people information from JSON file"""
-    with open('json/data.json') as json_file:
-        return json.load(json_file)
+def check_constraints(assignment, index):
+    """Check if the assignment meets the constraints in the ConstraintIndex"""
+    return index.check(assignment)
 
-def check_constraints(assignment, constraints):
-    """Check if the assignment meets the constraints"""
-    for person, recipient in assignment.items():
-        if recipient in constraints.get(person, []):
-            return False
+def generate_assignment(index, stats=None, seed=None, parallel_solvers=1):
+    """Generate a valid gift exchange assignment, or None if the constraints can't be satisfied"""
+    stats = stats if stats is not None else {}
+    if seed is None and parallel_solvers > 1:
+        cycle = find_gift_cycle_parallel(index, parallel_solvers, stats=stats)
+    else:
+        seed = seed if seed is not None else new_seed()
+        cycle = find_gift_cycle(index, random.Random(seed), stats=stats)
+        stats['seed'] = seed
+    # The seed reproduces the assignment, so it only goes in the assignment file
+    metrics.set('solver', {key: value for key, value in stats.items() if key != 'seed'})
+    if cycle is None:
+        return None
+    return {cycle[i]: cycle[(i + 1) % len(cycle)] for i in range(len(cycle))}
+
+def run_feasibility_check(index, hide_sensitive_output):
+    """Print pre-flight constraint diagnostics and return True if no problems were found"""
+    for warning in constraint_warnings(index, hide_sensitive_output):
+        print(f"{Colors.YELLOW}⚠️  {warning}{Colors.END}")
+
+    problems = check_feasibility(index, hide_sensitive_output)
+    if problems:
+        print("❌ Feasibility check failed: no single gift cycle can satisfy the roster")
+        for problem in problems:
+            print(f"  - {problem}")
+        return False
+
+    print(f"✅ Feasibility check passed for {len(index)} people!")
     return True
 
-def generate_assignment(people, constraints):
-    """Generate a valid gift exchange assignment"""
-    while True:
-        random.shuffle(people)
-        assignment = {people[i]: people[(i + 1) % len(people)] for i in range(len(people))}
-        if check_constraints(assignment, constraints):
-            return assignment
+def apply_pairing_history(s3_client, roster, years):
+    """Return (years, ConstraintIndex) for each number of recent years whose pairings can be ruled out, most years first"""
+    bucket_name = config('S3_BUCKET')
+    history = load_history(s3_client, bucket_name)
+    if sync_history(s3_client, bucket_name, history):
+        save_history(s3_client, bucket_name, history)
+    
+    # Drop the oldest years one at a time until a valid gift cycle is possible again
+    candidates = []
+    for recent_years in range(years, 0, -1):
+        index = ConstraintIndex(roster.names, merge_constraints(roster, past_recipients(history, recent_years)))
+        if check_feasibility(index, hide_names=True):
+            print(f"{Colors.YELLOW}⚠️  Avoiding repeat pairings from the last {recent_years} year(s) leaves no valid gift cycle.{Colors.END}")
+        else:
+            candidates.append((recent_years, index))
+    return candidates
+
+def simulate_run(args, index):
+    """Generate many assignments offline and report their uniformity and generation times"""
+    # Imported here since it pulls in NumPy, which only --simulate needs
+    from simulate import run_simulation, uniformity, timing_summary, WORST_GIVERS
+    workers = args.parallel_solvers if args.parallel_solvers > 1 else None
+    result = run_simulation(index, args.simulate, workers, args.seed)
+    times = timing_summary(result['times'])
+    
+    print(f"🎲 Simulated {result['runs']} assignments of {len(index)} people in {result['elapsed']:.2f}s on {result['workers']} processes (seed {result['seed']})")
+    found = result['statuses'].get('found', 0)
+    print(f"Solver results: {', '.join(f'{status} {count}' for status, count in sorted(result['statuses'].items()))}")
+    if result['methods']:
+        print(f"Solver methods: {', '.join(f'{method} {count}' for method, count in sorted(result['methods'].items()))}")
+    if result['invalid']:
+        print(f"❌ {result['invalid']} of {found} generated assignments failed validation!")
+    else:
+        print(f"✅ All {found} generated assignments passed validation")
+    if times:
+        print("Generation time: " + ', '.join(f"{name} {value * 1000:.2f} ms" for name, value in times.items()))
+    
+    report = {'runs': result['runs'], 'seed': result['seed'], 'statuses': result['statuses'], 'methods': result['methods'], 'invalid': result['invalid'], 'times': times}
+    if result['matrix'] is None:
+        print(f"{Colors.YELLOW}⚠️  Roster too large for a giver x recipient matrix, skipping the uniformity test.{Colors.END}")
+    else:
+        even = uniformity(result['matrix'], index)
+        print(f"Uniformity over allowed recipients: chi-square {even['chi2']:.1f} on {even['df']} degrees of freedom, p = {even['p_value']:.3f}")
+        worst = sorted(even['givers'], key=lambda entry: entry['p_value'])[:WORST_GIVERS]
+        for entry in worst:
+            if entry['p_value'] >= 0.01:
+                break
+            giver = 'A giver' if args.hide_sensitive_output else f"{Colors.BLUE}{entry['giver']}{Colors.END}"
+            print(f"{Colors.YELLOW}⚠️  {giver} got each of {entry['allowed']} allowed recipients {entry['min']}-{entry['max']} times "
+                  f"(expected {entry['expected']:.1f}, p = {entry['p_value']:.4f}){Colors.END}")
+        report.update(people=index.people, matrix=[[int(count) for count in row] for row in result['matrix']], uniformity=even)
+    
+    if args.simulate_report:
+        with open(args.simulate_report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"✅ Simulation report written to {args.simulate_report}")
+    return result['invalid'] == 0
 
 def print_dry_run_header(is_github_test, hide_sensitive_output):
     """Print the dry run header with appropriate formatting"""
@@ -45,24 +157,53 @@ def create_message(person, recipient):
     """Create the gift exchange message"""
     return f"Welcome to the Gift Exchange!\n\nHello {person}! Your gift recipient is {recipient}. Merry Christmas!\n\nReply STOP to unsubscribe."
 
+def create_update_message(person, recipient):
+    """Create the message for a giver whose recipient changed after a repair"""
+    return f"Gift Exchange update!\n\nHello {person}! There has been a change to the gift exchange and your gift recipient is now {recipient}. Merry Christmas!\n\nReply STOP to unsubscribe."
+
 def format_assignment_data(person, recipient, person_phone, message):
     """Format assignment data for output"""
     return f"{person} -> {recipient}\n  Preview message to {person} ({person_phone}):\n  {message}\n\n"
 
+def assignment_file_data(assignment, roster, is_dry_run, message_for=create_message, seed=None, history_years=0):
+    """Yield the assignment file one person at a time, so it can be streamed into the upload"""
+    if is_dry_run:
+        yield DRY_RUN_BANNER
+    if seed is not None:
+        # Past pairings added constraints of their own, so the rerun needs them too
+        if history_years:
+            rerun = f"--seed {seed} --avoid-repeats {history_years}, the same roster and the same pairing history"
+        else:
+            rerun = f"--seed {seed} and the same roster"
+        yield f"Solver seed: {seed} (run with {rerun} to reproduce this assignment)\n\n"
+    for person, recipient in assignment.items():
+        yield format_assignment_data(person, recipient, roster.phone_number(person), message_for(person, recipient))
+
 def print_assignment_info(person, recipient, person_phone, message, hide_sensitive_output, is_github_test):
     """Print assignment information to console (dry run only)"""
     if not hide_sensitive_output and not is_github_test:
         print(f"{Colors.GREEN}{person}{Colors.END} -> {Colors.YELLOW}{recipient}{Colors.END}")
         print(f"  Preview message to {Colors.GREEN}{person}{Colors.END} ({Colors.GREEN}{person_phone}{Colors.END}):\n  {Colors.BLUE}{message}{Colors.END}")
 
-def send_message(twilio_client, person_phone, message):
-    """Send SMS message via Twilio"""
-    twilio_phone = config('TWILIO_PHONE_NUMBER')
-    twilio_client.messages.create(
-        to=person_phone,
-        from_=twilio_phone,
-        body=message
-    )
+def send_messages(twilio_client, jobs, report_path=None, journal=None):
+    """Send all queued messages concurrently and return True if every one was sent"""
+    dispatcher = SmsDispatcher(twilio_client)
+    if journal:
+        results = dispatcher.send_all(jobs, journal.record_sending, journal.record_result)
+        journal.upload()
+    else:
+        results = dispatcher.send_all(jobs)
+    if report_path:
+        write_report(results, report_path)
+
+    failed = [result for result in results if result['status'] != 'sent']
+    metrics.count('sms_sent', len(results) - len(failed))
+    metrics.count('sms_failed', len(failed))
+    if failed:
+        print(f"❌ {len(failed)} of {len(results)} SMS messages failed to send.")
+        return False
+    print(f"✅ {len(results)} SMS messages sent!")
+    return True
 
 def print_upload_result(file_name, is_dry_run, is_github_test, hide_sensitive_output):
     """Print the S3 upload result message"""
@@ -74,54 +215,251 @@ def print_upload_result(file_name, is_dry_run, is_github_test, hide_sensitive_ou
         new_line = '\n' if not hide_sensitive_output else ''
         print(f"{new_line}{Colors.RED}DRY RUN{Colors.END} of gift assignments performed and file has been written to S3 as {Colors.GREEN}{file_name}{Colors.END}.")
 
+def resume_run(args):
+    """Finish an interrupted run from its send journal"""
+    metrics.begin_phase('connect')
+    session = ServiceSession()
+    if not session.check_connections():
+        exit(1)
+    s3_client = session.s3_client
+    
+    metrics.begin_phase('load_journal')
+    journal = SendJournal(args.resume, s3_client)
+    state = journal.load()
+    if state is None:
+        print(f"❌ No send journal found for run {args.resume}.")
+        exit(1)
+    
+    jobs = state['jobs']
+    pending = [job for job in jobs if state['status'].get(job['person']) != 'sent']
+    in_flight = sum(1 for job in pending if state['status'].get(job['person']) == 'in-flight')
+    print(f"📒 Resuming run {args.resume}: {len(jobs) - len(pending)} of {len(jobs)} messages were already sent.")
+    if in_flight:
+        print(f"{Colors.YELLOW}⚠️  {in_flight} messages were in flight when the run stopped and will be sent again.{Colors.END}")
+    
+    all_sent = True
+    if pending:
+        metrics.begin_phase('send')
+        all_sent = send_messages(session.twilio_client, pending, args.sms_report, journal)
+    
+    # Upload the assignment file if the interrupted run never got that far
+    file_name = state['file_name']
+    if file_name is None:
+        metrics.begin_phase('upload')
+        assignment_data = (
+            format_assignment_data(job['person'], job['recipient'], job['to'], job['body']) for job in jobs
+        )
+        assignment = {job['person']: job['recipient'] for job in jobs}
+        file_name = upload_assignment_data_to_s3(s3_client, assignment_data, assignment=assignment)
+        journal.record_upload(file_name)
+        journal.upload()
+        update_history(s3_client, file_name, assignment)
+    print_upload_result(file_name, False, False, args.hide_sensitive_output)
+    if not all_sent:
+        exit(1)
+
+def repair_run(args):
+    """Splice people who joined or dropped out into an earlier assignment and text only the givers it affects"""
+    metrics.begin_phase('load')
+    roster = load_people_data(args.data)
+    index = ConstraintIndex.from_roster(roster)
+    
+    metrics.begin_phase('connect')
+    session = ServiceSession()
+    if not session.check_connections():
+        exit(1)
+    s3_client = session.s3_client
+    
+    metrics.begin_phase('download')
+    previous = stream_assignments(s3_client, config('S3_BUCKET'), args.repair)
+    if not previous:
+        print(f"❌ Could not read the assignments in {args.repair}.")
+        exit(1)
+    
+    # Splice the cycle so only the people around each change get a new recipient
+    metrics.begin_phase('generate')
+    stats = {}
+    assignment = repair_cycle(previous, index, stats=stats)
+    metrics.set('repair', {key: len(value) if isinstance(value, list) else value for key, value in stats.items()})
+    if assignment is None:
+        if stats['status'] == INVALID:
+            print(f"❌ {args.repair} is not a single gift cycle, so it can't be repaired.")
+        else:
+            print(f"❌ Could not fit the changes into {args.repair} without breaking a constraint. Run a new gift exchange instead.")
+        exit(1)
+    assignment = dict(sorted(assignment.items(), key=lambda x: x[0]))  # Sort alphabetically
+    joined = set(stats['joined'])
+    changed = [person for person, recipient in assignment.items() if previous.get(person) != recipient]
+    print(f"🔧 Repairing {args.repair}: {len(joined)} joined, {len(stats['removed'])} dropped out, "
+          f"{len(changed)} givers have a new recipient.")
+    
+    # Write the whole updated assignment, but only message the givers whose recipient changed
+    metrics.begin_phase('format')
+    is_dry_run = args.dry_run or args.github_test
+    if is_dry_run:
+        print_dry_run_header(args.github_test, args.hide_sensitive_output)
+    changed_set = set(changed)
+    
+    def message_for(person, recipient):
+        if person in changed_set and person not in joined:
+            return create_update_message(person, recipient)
+        return create_message(person, recipient)
+    
+    jobs = []
+    for person in changed:
+        recipient = assignment[person]
+        person_phone = roster.phone_number(person)
+        message = message_for(person, recipient)
+        if is_dry_run:
+            print_assignment_info(person, recipient, person_phone, message, args.hide_sensitive_output, args.github_test)
+        else:
+            jobs.append({'person': person, 'recipient': recipient, 'to': person_phone, 'body': message})
+    
+    # Upload the new version first, so resuming an interrupted repair only has messages left to send
+    metrics.begin_phase('upload')
+    file_name = next_version_file_name(args.repair, is_dry_run)
+    assignment_data = assignment_file_data(assignment, roster, is_dry_run, message_for)
+    upload_assignment_data_to_s3(s3_client, assignment_data, args.dry_run, args.github_test, assignment, file_name)
+    if not is_dry_run:
+        update_history(s3_client, file_name, assignment)
+    
+    all_sent = True
+    if jobs:
+        metrics.begin_phase('journal')
+        journal = SendJournal(new_run_id(), s3_client)
+        journal.record_assignment(jobs)
+        journal.record_upload(file_name)
+        print(f"📒 Send journal run ID: {journal.run_id} (if this run is interrupted, use --resume {journal.run_id})")
+        
+        metrics.begin_phase('send')
+        all_sent = send_messages(session.twilio_client, jobs, args.sms_report, journal)
+    print_upload_result(file_name, args.dry_run, args.github_test, args.hide_sensitive_output)
+    metrics.end_phase()
+    if not all_sent:
+        exit(1)
+
 def main():
     # Parse arguments and load data
     args = parse_arguments()
-    people_info = load_people_data()
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json)
+    if args.profile:
+        profile_until_exit(args.profile)
+    if args.resume:
+        resume_run(args)
+        return
+    if args.repair:
+        repair_run(args)
+        return
+    metrics.begin_phase('load')
+    roster = load_people_data(args.data)
     
-    # Extract constraints and people list
-    constraints = {person: info['constraints'] for person, info in people_info.items()}
-    people = list(people_info.keys())
+    # Compile the constraints once for the generator and any checks
+    index = ConstraintIndex.from_roster(roster)
+    metrics.set('people', len(index))
     
-    # Setup and test connections
-    s3_client = setup_s3_client()
-    if not test_s3_connection(s3_client):
+    # Catch impossible constraints before spending time on network handshakes
+    metrics.begin_phase('feasibility')
+    if not run_feasibility_check(index, args.hide_sensitive_output or args.github_test):
         exit(1)
+    if args.check_feasibility:
+        return
+    if args.simulate is not None:
+        metrics.begin_phase('simulate')
+        if not simulate_run(args, index):
+            exit(1)
+        return
     
-    if not test_twilio_connection():
+    # Setup both clients once and test the connections at the same time
+    metrics.begin_phase('connect')
+    session = ServiceSession()
+    if not session.check_connections():
         exit(1)
+    s3_client = session.s3_client
+    
+    # Rule out recent years' pairings where the constraints allow it
+    history_indexes = []
+    if args.avoid_repeats > 0:
+        metrics.begin_phase('history')
+        try:
+            history_indexes = apply_pairing_history(s3_client, roster, args.avoid_repeats)
+        except Exception as e:
+            print(f"{Colors.YELLOW}⚠️  Could not load the pairing history: {e}{Colors.END}")
     
     # Generate assignment
-    assignment = generate_assignment(people, constraints)
+    metrics.begin_phase('generate')
+    stats = {}
+    assignment = None
+    history_years = 0
+    # Passing the feasibility check doesn't guarantee a cycle, so fall back to fewer years and then no history
+    for recent_years, history_index in history_indexes:
+        assignment = generate_assignment(history_index, stats, args.seed, args.parallel_solvers)
+        if assignment is not None:
+            history_years = recent_years
+            print(f"✅ Avoiding repeat pairings from the last {recent_years} year(s).")
+            break
+        print(f"{Colors.YELLOW}⚠️  No gift assignment found avoiding repeat pairings from the last {recent_years} year(s).{Colors.END}")
+        stats = {}
+    if assignment is None:
+        if args.avoid_repeats > 0:
+            print(f"{Colors.YELLOW}⚠️  Repeat pairings from past years are allowed in this run.{Colors.END}")
+        assignment = generate_assignment(index, stats, args.seed, args.parallel_solvers)
+    if assignment is None:
+        if stats.get('status') == INFEASIBLE:
+            print("❌ No valid gift assignment exists: the constraints in the roster are infeasible.")
+        else:
+            print("❌ Could not find a valid gift assignment within the search budget.")
+        exit(1)
     assignment = dict(sorted(assignment.items(), key=lambda x: x[0]))  # Sort alphabetically
     
     # Setup for message sending or dry run
     is_dry_run = args.dry_run or args.github_test
-    twilio_client = None if is_dry_run else setup_twilio_client()
+    twilio_client = None if is_dry_run else session.twilio_client
     
     # Print dry run header if needed
-    assignment_data = ""
+    metrics.begin_phase('format')
     if is_dry_run:
-        assignment_data += "---------------------------- DRY RUN ----------------------------\n\n"
         print_dry_run_header(args.github_test, args.hide_sensitive_output)
     
     # Process each assignment
+    jobs = []
     for person, recipient in assignment.items():
-        person_phone = people_info[person]['phone_number']
+        person_phone = roster.phone_number(person)
         message = create_message(person, recipient)
         
-        # Add to assignment data for S3 upload
-        assignment_data += format_assignment_data(person, recipient, person_phone, message)
-        
         # Send message or print info
         if is_dry_run:
             print_assignment_info(person, recipient, person_phone, message, args.hide_sensitive_output, args.github_test)
         else:
-            send_message(twilio_client, person_phone, message)
+            jobs.append({'person': person, 'recipient': recipient, 'to': person_phone, 'body': message})
     
-    # Upload to S3 and print result
-    file_name = upload_assignment_data_to_s3(s3_client, assignment_data, args.dry_run, args.github_test)
+    # Journal the assignment before sending so an interrupted run can be resumed
+    journal = None
+    if jobs:
+        metrics.begin_phase('journal')
+        journal = SendJournal(new_run_id(), s3_client)
+        journal.record_assignment(jobs)
+        print(f"📒 Send journal run ID: {journal.run_id} (if this run is interrupted, use --resume {journal.run_id})")
+    
+    # Send the queued messages concurrently
+    all_sent = True
+    if jobs:
+        metrics.begin_phase('send')
+        all_sent = send_messages(twilio_client, jobs, args.sms_report, journal)
+    
+    # Stream the assignment file into a compressed upload to S3 and print result
+    metrics.begin_phase('upload')
+    assignment_data = assignment_file_data(assignment, roster, is_dry_run, seed=stats.get('seed'), history_years=history_years)
+    file_name = upload_assignment_data_to_s3(s3_client, assignment_data, args.dry_run, args.github_test, assignment)
+    if journal:
+        journal.record_upload(file_name)
+        journal.upload()
+    if not is_dry_run:
+        update_history(s3_client, file_name, assignment)
     print_upload_result(file_name, args.dry_run, args.github_test, args.hide_sensitive_output)
+    metrics.end_phase()
+    if not all_sent:
+        exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file